@@ -5,6 +5,7 @@ import pytest
 import graph_test_suite
 import networkx as nx
 import numpy as np
+import warnings
 
 suite = graph_test_suite.get_full_suite()
 
@@ -276,4 +277,863 @@ def test_negative_cycles():
         algs.get_shortest_paths(g,True)
     assert np.array_equal(algs.get_shortest_paths(g,False),np.array([[0,1,1],
                                                 [1,0,1],
-                                                [1,1,0]],dtype=np.float64))
\ No newline at end of file
+                                                [1,1,0]],dtype=np.float64))
+
+
+@pytest.mark.parametrize("test_name", [k for k in suite.keys()])
+def test_johnson_matches_floyd_warshall(test_name):
+    """
+    Johnson's algorithm should give the same distances as Floyd-Warshall, and
+    its next matrix should trace out paths of exactly those lengths.
+    """
+    for g in suite[test_name]:
+        weighted = np.issubdtype(g.adjacency.dtype, np.number)
+        fw_d = algs.get_shortest_paths(g, weighted, method='floyd_warshall')
+        j_d, j_next = algs.get_shortest_paths(g, weighted, True, 
+                                              method='johnson')
+        np.testing.assert_allclose(j_d, fw_d)
+
+        # every first step must be an edge that starts a shortest path
+        reachable = np.isfinite(j_d)
+        assert np.all(np.isinf(j_next[~reachable]))
+        np.fill_diagonal(reachable, False)
+        i, j = np.nonzero(reachable)
+        k = j_next[i, j].astype(int)
+        w = g.adjacency[i, k].astype(np.float64) if weighted else 1
+        assert np.all(g.adjacency[i, k] != tg.default_zero(g.adjacency.dtype))
+        np.testing.assert_allclose(w + j_d[k, j], j_d[i, j])
+
+def test_johnson_negative_cycles():
+    """
+    Johnson's algorithm detects negative cycles like Floyd-Warshall does.
+    """
+    g = tg.TinyGraph(3)
+    g[0,1] = 1
+    g[1,2] = -5
+    g[2,0] = 1
+
+    with pytest.raises(Exception, match='Graph has a negative cycle.'):
+        algs.get_shortest_paths(g, True, method='johnson')
+    assert np.array_equal(algs.get_shortest_paths(g, False, method='johnson'),
+                          np.array([[0,1,1],
+                                    [1,0,1],
+                                    [1,1,0]],dtype=np.float64))
+
+def test_shortest_paths_method():
+    """
+    Large sparse graphs use Johnson's algorithm automatically, small or dense 
+    graphs Floyd-Warshall, and unknown methods are rejected.
+    """
+    from tinygraph.fastutils import _choose_shortest_paths_method
+
+    N = 400
+    g = tg.TinyGraph(N)
+    for i in range(N - 1):
+        g[i, i+1] = 1
+    assert _choose_shortest_paths_method(g) == 'johnson'
+    assert _choose_shortest_paths_method(tg.util.subgraph(g, range(128))) \
+        == 'floyd_warshall'
+    g.adjacency[:] = 1
+    np.fill_diagonal(g.adjacency, 0)
+    assert _choose_shortest_paths_method(g) == 'floyd_warshall'
+
+    with pytest.raises(ValueError):
+        algs.get_shortest_paths(g, True, method='dijkstra')
+
+def test_shortest_paths_batch():
+    """
+    Batched shortest paths match get_shortest_paths graph by graph, for lists
+    of graphs and for packed batches.
+    """
+    graphs = [g for name in list(suite.keys())[:20] for g in suite[name]]
+    graphs = [g for g in graphs if np.issubdtype(g.adjacency.dtype, np.number)]
+    graphs.append(tg.TinyGraph(0))
+
+    for weighted in [True, False]:
+        dists, nexts = algs.get_shortest_paths_batch(graphs, weighted, True)
+        for g, d, n in zip(graphs, dists, nexts):
+            exp_d, exp_n = algs.get_shortest_paths(g, weighted, True, 
+                                                   method='floyd_warshall')
+            np.testing.assert_array_equal(d, exp_d)
+            np.testing.assert_array_equal(n, exp_n)
+
+        flat, offsets = algs.get_shortest_paths_batch(graphs, weighted, 
+                                                      ragged=True)
+        assert len(offsets) == len(graphs) + 1
+        for i, g in enumerate(graphs):
+            np.testing.assert_array_equal(
+                flat[offsets[i]:offsets[i+1]].reshape(g.vert_N, g.vert_N),
+                dists[i])
+
+        packed = np.concatenate([g.adjacency.ravel() for g in graphs])
+        sizes = [g.vert_N for g in graphs]
+        packed_dists = algs.get_shortest_paths_batch(packed, weighted, 
+                                                     sizes=sizes)
+        for d, exp_d in zip(packed_dists, dists):
+            np.testing.assert_array_equal(d, exp_d)
+
+def test_shortest_paths_batch_negative_cycle():
+    """
+    A negative cycle in any graph of the batch raises.
+    """
+    g = tg.TinyGraph(3)
+    g[0,1] = 1
+    g[1,2] = -5
+    g[2,0] = 1
+
+    with pytest.raises(Exception, match='Graph 1 has a negative cycle.'):
+        algs.get_shortest_paths_batch([tg.TinyGraph(2), g], True)
+    with pytest.raises(TypeError, match='Graph weights are not numbers.'):
+        algs.get_shortest_paths_batch([tg.TinyGraph(2, np.bool)], True)
+
+@pytest.mark.parametrize("dtype", [np.bool, np.int8, np.int32, np.int64,
+                                   np.float32, np.float64])
+def test_adjacency_dtypes(dtype):
+    """
+    The compiled algorithms read every adjacency dtype, including read-only
+    adjacency matrices, and agree with a float64 copy of the graph.
+    """
+    g = tg.TinyGraph(6, dtype)
+    g[0,1] = 1
+    g[1,2] = 1
+    g[2,0] = 1
+    g[3,4] = 1
+    ref = tg.TinyGraph(6, np.float64)
+    ref.adjacency[:] = g.adjacency
+    g.adjacency.setflags(write=False)
+
+    assert algs.get_connected_components(g) == \
+        algs.get_connected_components(ref)
+    np.testing.assert_array_equal(tg.fastutils.get_all_neighbors(g),
+                                  tg.fastutils.get_all_neighbors(ref))
+    np.testing.assert_array_equal(algs.get_shortest_paths(g, False),
+                                  algs.get_shortest_paths(ref, False))
+    if dtype != np.bool:
+        np.testing.assert_array_equal(algs.get_shortest_paths(g, True),
+                                      algs.get_shortest_paths(ref, True))
+
+def test_complex_adjacency():
+    """
+    An edge whose weight is purely imaginary is still an edge for every 
+    structural algorithm, and complex weights do not emit ComplexWarnings.
+    """
+    g = tg.TinyGraph(3, np.complex64)
+    g[0,1] = 1j
+    g[1,2] = 1
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        for method in ['floyd_warshall', 'johnson']:
+            np.testing.assert_array_equal(
+                algs.get_shortest_paths(g, False, method=method), 
+                [[0, 1, 2], [1, 0, 1], [2, 1, 0]])
+        assert algs.get_connected_components(g) == [{0, 1, 2}]
+        assert algs.is_connected(g)
+        index = algs.get_neighbor_index(g)
+        np.testing.assert_array_equal(index.indices, [1, 0, 2, 1])
+        np.testing.assert_array_equal(index.weights, [0, 0, 1, 1])
+
+        g[0,1] = 2 + 1j
+        np.testing.assert_array_equal(algs.get_shortest_paths(g, True),
+                                      [[0, 2, 3], [2, 0, 1], [3, 1, 0]])
+        g[0,1] = 1j
+        np.testing.assert_array_equal(
+            algs.get_shortest_paths_batch([g, g], False)[1],
+            [[0, 1, 2], [1, 0, 1], [2, 1, 0]])
+        np.testing.assert_array_equal(
+            algs.get_shortest_paths_batch(g.adjacency.ravel(), False, 
+                                          sizes=[3])[0],
+            [[0, 1, 2], [1, 0, 1], [2, 1, 0]])
+
+def test_neighbor_index():
+    """
+    The CSR neighbor index lists sorted neighbors and weights, is cached on
+    the graph and is rebuilt after the graph changes.
+    """
+    g = tg.TinyGraph(4, np.int32)
+    g[0,1] = 2
+    g[0,3] = 5
+    g[2,3] = 1
+
+    index = algs.get_neighbor_index(g)
+    np.testing.assert_array_equal(index.offsets, [0, 2, 3, 4, 6])
+    np.testing.assert_array_equal(index.indices, [1, 3, 0, 3, 0, 2])
+    np.testing.assert_array_equal(index.weights, [2, 5, 2, 1, 5, 1])
+    np.testing.assert_array_equal(index.degrees, [2, 1, 1, 2])
+    assert algs.get_neighbor_index(g) is index
+
+    g[1,2] = 1
+    index = algs.get_neighbor_index(g)
+    np.testing.assert_array_equal(index.indices, [1, 3, 0, 2, 1, 3, 0, 2])
+    assert algs.is_connected(g)
+
+    g.adjacency[1,2] = g.adjacency[2,1] = 0
+    g.invalidate_caches()
+    assert algs.get_neighbor_index(g) is not index
+    assert algs.get_connected_components(g) == [{0, 1, 2, 3}]
+
+    g.add_vertex()
+    assert algs.get_neighbor_index(g).vert_N == 5
+    assert not algs.is_connected(g)
+    g.remove_vertex(4)
+    assert algs.is_connected(g)
+
+@pytest.mark.parametrize("test_name", [k for k in suite.keys()])
+def test_neighbor_index_suite(test_name):
+    """
+    The neighbor index agrees with get_neighbors on every vertex.
+    """
+    for g in suite[test_name]:
+        index = algs.get_neighbor_index(g)
+        for i in range(g.vert_N):
+            nbrs = index.indices[index.offsets[i]:index.offsets[i+1]]
+            np.testing.assert_array_equal(nbrs, g.get_neighbors(i))
+
+def test_dynamic_connectivity():
+    """
+    The connectivity attached to a graph follows edge insertions and 
+    deletions, and agrees with the connected components throughout.
+    """
+    rng = np.random.RandomState(0)
+    g = tg.TinyGraph(12, np.int32)
+    conn = algs.get_connectivity(g)
+    assert conn.component_N == 12
+    for step in range(300):
+        i, j = rng.choice(12, 2, replace=False)
+        g[i, j] = rng.randint(3) if step > 100 else 1
+        conn = algs.get_connectivity(g)
+
+        labels = algs.get_component_labels(g)
+        assert conn.component_N == len(algs.get_connected_components(g))
+        np.testing.assert_array_equal(conn.get_component_labels(), labels)
+        assert conn.same_component(i, j) == (labels[i] == labels[j])
+        assert conn.component_size(i) == np.sum(labels == labels[i])
+        assert algs.is_connected(g) == (conn.component_N == 1)
+
+    # insertions are applied in place, deletions cause a rebuild
+    g = tg.TinyGraph(4)
+    conn = algs.get_connectivity(g)
+    g[0, 1] = 1
+    g[2, 3] = 1
+    assert algs.get_connectivity(g) is conn
+    assert conn.component_N == 2
+    g[1, 2] = 1
+    assert algs.get_connectivity(g) is conn
+    assert algs.is_connected(g)
+    g[1, 2] = 0
+    assert algs.get_connectivity(g) is not conn
+    assert not algs.is_connected(g)
+
+    g.adjacency[1, 2] = g.adjacency[2, 1] = 1
+    g.invalidate_caches()
+    assert algs.is_connected(g)
+
+    # built on a graph that already has edges, where component labels and
+    # representative vertices differ
+    g = tg.TinyGraph(4)
+    g[0, 1] = 1
+    g[2, 3] = 1
+    assert not algs.is_connected(g)
+    conn = algs.get_connectivity(g)
+    assert not conn.same_component(3, 0)
+    g[3, 0] = 1
+    assert algs.get_connectivity(g) is conn
+    assert algs.is_connected(g)
+    np.testing.assert_array_equal(conn.get_component_labels(), [0, 0, 0, 0])
+
+    rng = np.random.RandomState(1)
+    for _ in range(20):
+        g = tg.TinyGraph(15, np.int32)
+        for _ in range(8):
+            i, j = rng.choice(15, 2, replace=False)
+            g[i, j] = 1
+        g.invalidate_caches()
+        algs.get_connectivity(g)
+        for _ in range(10):
+            i, j = rng.choice(15, 2, replace=False)
+            g[i, j] = 1
+            conn = algs.get_connectivity(g)
+            labels = algs.get_component_labels(g)
+            np.testing.assert_array_equal(conn.get_component_labels(), labels)
+            assert conn.component_N == labels.max() + 1
+
+@pytest.mark.parametrize("weighted", [True, False])
+def test_update_shortest_paths(weighted):
+    """
+    Updating the shortest paths after each edge change agrees with 
+    recomputing them, and next keeps describing shortest paths.
+    """
+    rng = np.random.RandomState(1)
+    g = tg.io.from_nx(nx.gnm_random_graph(12, 20, seed=3), 
+                      adj_type=np.float64)
+    for i, j in g.edges():
+        g[i, j] = rng.randint(1, 5)
+    distances, next = algs.get_shortest_paths(g, weighted, paths=True)
+    only_distances = distances.copy()
+    for step in range(200):
+        i, j = rng.choice(12, 2, replace=False)
+        g[i, j] = 0 if rng.rand() < 0.4 else rng.randint(1, 6)
+        distances, next = algs.update_shortest_paths(g, distances, next, 
+                                                     i, j, weighted)
+        only_distances = algs.update_shortest_paths(g, only_distances, None,
+                                                    i, j, weighted)
+        expected = algs.get_shortest_paths(g, weighted)
+        np.testing.assert_array_equal(distances, expected)
+        np.testing.assert_array_equal(only_distances, expected)
+
+        a, b = np.nonzero(np.isfinite(distances) & ~np.eye(12, dtype=bool))
+        steps = next[a, b].astype(int)
+        assert np.all(g.adjacency[a, steps] != 0)
+        lengths = g.adjacency[a, steps] if weighted else 1
+        np.testing.assert_allclose(lengths + distances[steps, b], 
+                                   distances[a, b])
+
+    g[0, 1] = -1
+    with pytest.raises(Exception, match="negative cycle"):
+        algs.update_shortest_paths(g, distances, next, 0, 1, True)
+
+def centrality_test_graphs():
+    """
+    Small random graphs with integer weights, as TinyGraphs and networkx 
+    graphs.
+    """
+    rng = np.random.RandomState(0)
+    out = []
+    for seed in range(20):
+        nx_g = nx.gnm_random_graph(rng.randint(1, 14), rng.randint(0, 25), 
+                                   seed=seed)
+        g = tg.TinyGraph(nx_g.number_of_nodes(), np.float64)
+        for u, v in nx_g.edges():
+            nx_g[u][v]['weight'] = g[u, v] = rng.randint(1, 4)
+        out.append((g, nx_g))
+    return out
+
+@pytest.mark.parametrize("weighted", [True, False])
+def test_centrality_matches_nx(weighted):
+    """
+    Betweenness, edge betweenness, closeness and harmonic centrality agree 
+    with networkx.
+    """
+    weight = 'weight' if weighted else None
+    for g, nx_g in centrality_test_graphs():
+        vertices = range(g.vert_N)
+        for normalized in [True, False]:
+            nx_b = nx.betweenness_centrality(nx_g, weight=weight, 
+                                             normalized=normalized)
+            np.testing.assert_allclose(
+                algs.get_betweenness_centrality(g, weighted, normalized),
+                [nx_b[v] for v in vertices])
+
+            nx_eb = nx.edge_betweenness_centrality(nx_g, weight=weight,
+                                                   normalized=normalized)
+            expected = np.zeros((g.vert_N, g.vert_N))
+            for (u, v), b in nx_eb.items():
+                expected[u, v] = expected[v, u] = b
+            np.testing.assert_allclose(
+                algs.get_edge_betweenness_centrality(g, weighted, normalized),
+                expected)
+
+        nx_c = nx.closeness_centrality(nx_g, distance=weight)
+        np.testing.assert_allclose(algs.get_closeness_centrality(g, weighted),
+                                   [nx_c[v] for v in vertices])
+        nx_h = nx.harmonic_centrality(nx_g, distance=weight)
+        np.testing.assert_allclose(algs.get_harmonic_centrality(g, weighted),
+                                   [nx_h[v] for v in vertices])
+
+def test_centrality_batch():
+    """
+    The batch centralities are those of the single graphs.
+    """
+    graphs = [g for g, _ in centrality_test_graphs()] + [tg.TinyGraph(0)]
+    offsets, betweenness, closeness, harmonic, edge_betweenness = \
+        algs.get_centrality_batch(graphs, weighted=True)
+    assert len(offsets) == len(graphs) + 1
+    for b, g in enumerate(graphs):
+        vertices = slice(offsets[b], offsets[b+1])
+        np.testing.assert_allclose(betweenness[vertices],
+                                   algs.get_betweenness_centrality(g, True))
+        np.testing.assert_allclose(closeness[vertices],
+                                   algs.get_closeness_centrality(g, True))
+        np.testing.assert_allclose(harmonic[vertices],
+                                   algs.get_harmonic_centrality(g, True))
+        np.testing.assert_allclose(
+            edge_betweenness[b], algs.get_edge_betweenness_centrality(g, True))
+
+    g = tg.TinyGraph(2)
+    g[0, 1] = -1
+    with pytest.raises(ValueError):
+        algs.get_betweenness_centrality(g, weighted=True)
+
+def test_biconnected_components_nx():
+    """
+    Articulation points, bridges and biconnected components agree with 
+    networkx on random graphs.
+    """
+    for seed in range(200):
+        rng = np.random.RandomState(seed)
+        n = rng.randint(0, 15)
+        nx_g = nx.gnm_random_graph(n, rng.randint(0, 2*n + 1), seed=seed)
+        g = tg.io.from_nx(nx_g)
+        articulation, bridges, components = algs.get_biconnected_components(g)
+
+        assert set(np.flatnonzero(articulation)) == \
+            set(nx.articulation_points(nx_g))
+        assert list(map(tuple, bridges)) == \
+            sorted(tuple(sorted(e)) for e in nx.bridges(nx_g))
+
+        np.testing.assert_array_equal(components, components.T)
+        np.testing.assert_array_equal(components >= 0, g.adjacency != 0)
+        nx_components = list(nx.biconnected_component_edges(nx_g))
+        assert len(np.unique(components[components >= 0])) == \
+            len(nx_components)
+        for edges in nx_components:
+            assert len({components[u, v] for u, v in edges}) == 1
+
+def test_biconnected_components_simple():
+    """
+    Two triangles joined by a path.
+    """
+    g = tg.TinyGraph(7)
+    for i, j in [(0, 1), (1, 2), (2, 0), (2, 3), (3, 4), (4, 5), (5, 6), 
+                 (6, 4)]:
+        g[i, j] = 1
+    articulation, bridges, components = algs.get_biconnected_components(g)
+    np.testing.assert_array_equal(np.flatnonzero(articulation), [2, 3, 4])
+    np.testing.assert_array_equal(bridges, [[2, 3], [3, 4]])
+    assert components[0, 1] == components[1, 2] == components[0, 2]
+    assert components[4, 5] == components[5, 6] == components[4, 6]
+    assert len(np.unique(components)) == 5
+    assert components[0, 3] == -1
+
+def test_min_spanning_forest_nx():
+    """
+    The spanning forest has the size and weight of networkx's minimum 
+    spanning tree, as arrays, as a graph and in a batch.
+    """
+    rng = np.random.RandomState(0)
+    graphs = []
+    for seed in range(100):
+        n = rng.randint(0, 15)
+        nx_g = nx.gnm_random_graph(n, rng.randint(0, 3*n + 1), seed=seed)
+        g = tg.TinyGraph(n, np.float64, ep_types={'order' : np.int32})
+        for u, v in nx_g.edges():
+            nx_g[u][v]['weight'] = g[u, v] = rng.randint(-2, 5) or 1
+            g.e['order'][u, v] = u + v
+        graphs.append(g)
+
+        edges, weights = algs.get_min_spanning_forest(g)
+        nx_tree = nx.minimum_spanning_tree(nx_g)
+        assert len(edges) == nx_tree.number_of_edges()
+        assert np.isclose(weights.sum(), nx_tree.size(weight='weight'))
+        assert np.all(edges[:, 0] < edges[:, 1])
+        np.testing.assert_array_equal(weights, g.adjacency[edges[:, 0], 
+                                                           edges[:, 1]])
+
+        forest = algs.get_min_spanning_forest(g, as_graph=True)
+        assert forest.edge_N == len(edges)
+        assert algs.get_connected_components(forest) == \
+            algs.get_connected_components(g)
+        for i, j in edges:
+            assert forest[i, j] == g[i, j]
+            assert forest.e['order'][j, i] == i + j
+
+        assert len(algs.get_min_spanning_forest(g, weighted=False)[0]) == \
+            len(edges)
+
+    offsets, edges, weights = algs.get_min_spanning_forest_batch(graphs)
+    for b, g in enumerate(graphs):
+        g_edges, g_weights = algs.get_min_spanning_forest(g)
+        np.testing.assert_array_equal(edges[offsets[b]:offsets[b+1]], g_edges)
+        np.testing.assert_array_equal(weights[offsets[b]:offsets[b+1]], 
+                                      g_weights)
+
+@pytest.mark.parametrize("k", [0, 1, 2, 3])
+def test_k_hop_neighborhoods(k):
+    """
+    The k-hop neighborhoods and ego subgraphs agree with networkx and 
+    util.subgraph.
+    """
+    for seed in range(30):
+        rng = np.random.RandomState(seed)
+        n = rng.randint(0, 15)
+        nx_g = nx.gnm_random_graph(n, rng.randint(0, 2*n + 1), seed=seed)
+        g = tg.TinyGraph(n, np.int32)
+        for u, v in nx_g.edges():
+            g[u, v] = rng.randint(1, 4)
+
+        indptr, members = algs.get_k_hop_neighborhoods(g, k)
+        bitset = algs.get_k_hop_neighborhoods(g, k, bitset=True)
+        assert bitset.shape == (n, (n + 7) // 8)
+        for v in range(n):
+            expected = sorted(nx.single_source_shortest_path_length(
+                nx_g, v, cutoff=k))
+            np.testing.assert_array_equal(members[indptr[v]:indptr[v+1]], 
+                                          expected)
+            np.testing.assert_array_equal(
+                np.flatnonzero(np.unpackbits(bitset[v], count=n)), expected)
+
+        adjacency, sizes, offsets, indptr, members, centers = \
+            algs.get_ego_subgraphs_batch(g, k)
+        assert adjacency.dtype == g.adjacency.dtype
+        for v in range(n):
+            vertices = members[indptr[v]:indptr[v+1]]
+            np.testing.assert_array_equal(
+                adjacency[offsets[v]:offsets[v+1]].reshape(sizes[v], sizes[v]),
+                tg.util.subgraph(g, vertices).adjacency)
+            assert vertices[centers[v]] == v
+
+    with pytest.raises(ValueError):
+        algs.get_k_hop_neighborhoods(g, -1)
+
+def test_random_walks():
+    """
+    Walks follow edges, are reproducible from the seed, and take each step 
+    with the uniform, weighted or node2vec transition probabilities.
+    """
+    g = tg.TinyGraph(5, np.float64)
+    g[0, 1] = g[1, 2] = g[2, 0] = 1
+    g[2, 3] = 3
+
+    walks = algs.get_random_walks(g, 10, n_walks=20, rng=0)
+    assert walks.shape == (100, 10) and walks.dtype == np.int32
+    np.testing.assert_array_equal(walks[:5, 0], np.arange(5))
+    np.testing.assert_array_equal(walks[4], [4] + [-1] * 9)
+    steps = walks[:4]
+    assert np.all(g.adjacency[steps[:, :-1], steps[:, 1:]] != 0)
+    np.testing.assert_array_equal(walks, 
+                                  algs.get_random_walks(g, 10, n_walks=20, 
+                                                        rng=0))
+
+    n = 100000
+    walks = algs.get_random_walks(g, 2, starts=[2], n_walks=n, rng=1)
+    np.testing.assert_allclose(np.bincount(walks[:, 1], minlength=5) / n,
+                               [1/3, 1/3, 0, 1/3, 0], atol=0.01)
+    walks = algs.get_random_walks(g, 2, starts=[2], n_walks=n, weighted=True,
+                                  rng=2)
+    np.testing.assert_allclose(np.bincount(walks[:, 1], minlength=5) / n,
+                               [0.2, 0.2, 0, 0.6, 0], atol=0.01)
+
+    # from 2, having come from 0: back to 0 with 1/p, to 1 (a neighbor of 0)
+    # with 1, to 3 with 1/q
+    for weighted, expected in [(False, [2, 1, 0, 0.5, 0]), 
+                               (True, [2, 1, 0, 1.5, 0])]:
+        walks = algs.get_random_walks(g, 3, starts=[0], n_walks=n, 
+                                      weighted=weighted, p=0.5, q=2, rng=3)
+        third = walks[walks[:, 1] == 2, 2]
+        np.testing.assert_allclose(np.bincount(third, minlength=5) / 
+                                   len(third), 
+                                   np.array(expected) / sum(expected), 
+                                   atol=0.01)
+
+    out = np.zeros((10, 4), dtype=np.int32)
+    assert algs.get_random_walks(g, 4, n_walks=2, out=out, rng=0) is out
+    with pytest.raises(ValueError):
+        algs.get_random_walks(g, 5, n_walks=2, out=out)
+    with pytest.raises(ValueError):
+        algs.get_random_walks(g, 5, p=0)
+    with pytest.raises(IndexError):
+        algs.get_random_walks(g, 5, starts=[5])
+
+@pytest.mark.parametrize("method", ['auto', 'dense', 'sparse'])
+def test_triangles_clustering_nx(method):
+    """
+    Triangles, clustering and transitivity agree with networkx, also in a
+    batch.
+    """
+    graphs = []
+    for seed in range(40):
+        rng = np.random.RandomState(seed)
+        n = rng.choice([0, 1, 5, 12, 70])
+        m = rng.randint(0, max(1, n * (n - 1) // 2)) if n < 20 else \
+            rng.randint(0, 300)
+        nx_g = nx.gnm_random_graph(n, m, seed=seed)
+        g = tg.io.from_nx(nx_g)
+        graphs.append(g)
+
+        nx_t = nx.triangles(nx_g)
+        nx_c = nx.clustering(nx_g)
+        np.testing.assert_array_equal(algs.get_triangles(g, method), 
+                                      [nx_t[v] for v in range(n)])
+        np.testing.assert_allclose(algs.get_clustering(g, method), 
+                                   [nx_c[v] for v in range(n)])
+        if n > 0:
+            assert np.isclose(algs.get_average_clustering(g, method), 
+                              nx.average_clustering(nx_g))
+        assert np.isclose(algs.get_transitivity(g, method), 
+                          nx.transitivity(nx_g))
+
+    offsets, triangles, clustering, average, transitivity = \
+        algs.get_clustering_batch(graphs, method)
+    for b, g in enumerate(graphs):
+        vertices = slice(offsets[b], offsets[b+1])
+        np.testing.assert_array_equal(triangles[vertices], 
+                                      algs.get_triangles(g))
+        np.testing.assert_allclose(clustering[vertices], 
+                                   algs.get_clustering(g))
+        assert np.isclose(average[b], algs.get_average_clustering(g))
+        assert np.isclose(transitivity[b], algs.get_transitivity(g))
+
+    with pytest.raises(ValueError):
+        algs.get_triangles(graphs[0], 'fast')
+
+def test_distance_descriptors_nx():
+    """
+    Distance descriptors agree with networkx and with their definitions, 
+    also in a batch.
+    """
+    graphs = []
+    for seed in range(40):
+        rng = np.random.RandomState(seed)
+        n = rng.randint(1, 12)
+        nx_g = nx.gnm_random_graph(n, rng.randint(0, n*(n-1)//2 + 1), 
+                                   seed=seed)
+        g = tg.io.from_nx(nx_g)
+        graphs.append(g)
+        d = algs.get_distance_descriptors(g, n_bins=4)
+
+        if nx.is_connected(nx_g):
+            assert np.isclose(d['wiener'], nx.wiener_index(nx_g))
+            ecc = nx.eccentricity(nx_g)
+            np.testing.assert_array_equal(d['eccentricity'], 
+                                          [ecc[v] for v in range(n)])
+            assert d['diameter'] == nx.diameter(nx_g)
+            assert d['radius'] == nx.radius(nx_g)
+        else:
+            assert d['wiener'] == np.inf
+            assert d['diameter'] == np.inf
+
+        lengths = dict(nx.all_pairs_shortest_path_length(nx_g))
+        histogram = np.zeros(4)
+        for i in range(n):
+            for j in range(i + 1, n):
+                if j in lengths[i]:
+                    histogram[min(lengths[i][j], 4) - 1] += 1
+        np.testing.assert_array_equal(d['distance_histogram'], histogram)
+
+    graphs.append(tg.TinyGraph(0))
+    batch = algs.get_distance_descriptors_batch(graphs, n_bins=4)
+    offsets = batch['offsets']
+    for b, g in enumerate(graphs):
+        d = algs.get_distance_descriptors(g, n_bins=4)
+        for name, value in d.items():
+            if name == 'eccentricity':
+                np.testing.assert_array_equal(
+                    batch[name][offsets[b]:offsets[b+1]], value)
+            else:
+                np.testing.assert_array_equal(batch[name][b], value)
+
+def test_distance_descriptors_balaban():
+    """
+    Balaban J of hexane and benzene, and only the requested descriptors.
+    """
+    hexane = tg.io.from_nx(nx.path_graph(6))
+    benzene = tg.io.from_nx(nx.cycle_graph(6))
+    assert np.isclose(
+        algs.get_distance_descriptors(hexane, ['balaban_j'])['balaban_j'], 
+        2.3391, atol=1e-4)
+    d = algs.get_distance_descriptors(benzene, ['balaban_j', 'wiener'], 
+                                      distances=algs.get_shortest_paths(
+                                          benzene, False))
+    assert d == {'balaban_j' : 2.0, 'wiener' : 27.0}
+    with pytest.raises(ValueError):
+        algs.get_distance_descriptors(benzene, ['zagreb'])
+
+@pytest.mark.parametrize("weighted", [True, False])
+def test_extrema_nx(weighted):
+    """
+    Diameter, radius, center and periphery from eccentricity bounds agree 
+    with networkx.
+    """
+    weight = 'weight' if weighted else None
+    for seed in range(100):
+        rng = np.random.RandomState(seed)
+        n = rng.randint(1, 25)
+        nx_g = nx.gnm_random_graph(n, rng.randint(n - 1, 2*n + 1), seed=seed)
+        g = tg.TinyGraph(n, np.float64)
+        for u, v in nx_g.edges():
+            nx_g[u][v]['weight'] = g[u, v] = rng.randint(1, 5)
+
+        diameter, radius, center, periphery = algs.get_extrema(g, weighted)
+        if not nx.is_connected(nx_g):
+            assert diameter == radius == np.inf
+            continue
+        assert diameter == nx.diameter(nx_g, weight=weight)
+        assert radius == nx.radius(nx_g, weight=weight)
+        np.testing.assert_array_equal(center, 
+                                      sorted(nx.center(nx_g, weight=weight)))
+        np.testing.assert_array_equal(
+            periphery, sorted(nx.periphery(nx_g, weight=weight)))
+
+    assert algs.get_extrema(tg.TinyGraph(0))[:2] == (0, 0)
+
+def test_extrema_real_weights():
+    """
+    With non-integer weights the rounded bounds never meet exactly, yet all
+    four outputs still agree with networkx eccentricities (compared up to 
+    rounding, as networkx sums each path in its own order).
+    """
+    for seed in range(400):
+        rng = np.random.RandomState(seed)
+        n = rng.randint(2, 30)
+        nx_g = nx.gnm_random_graph(n, rng.randint(n - 1, 2*n + 1), seed=seed)
+        if not nx.is_connected(nx_g):
+            continue
+        g = tg.TinyGraph(n, np.float64)
+        for u, v in nx_g.edges():
+            nx_g[u][v]['weight'] = g[u, v] = rng.rand() + 0.1
+
+        diameter, radius, center, periphery = algs.get_extrema(g, True)
+        ecc = nx.eccentricity(nx_g, weight='weight')
+        ecc = np.array([ecc[v] for v in range(n)])
+        np.testing.assert_allclose(diameter, ecc.max(), rtol=1e-12)
+        np.testing.assert_allclose(radius, ecc.min(), rtol=1e-12)
+        np.testing.assert_array_equal(
+            center, np.flatnonzero(np.isclose(ecc, ecc.min(), rtol=1e-12)))
+        np.testing.assert_array_equal(
+            periphery, np.flatnonzero(np.isclose(ecc, ecc.max(), rtol=1e-12)))
+
+def test_laplacians_nx():
+    """
+    Laplacians and the normalized adjacency agree with networkx and their 
+    definitions, and the batched eigendecomposition diagonalizes them.
+    """
+    graphs = []
+    for seed in range(30):
+        rng = np.random.RandomState(seed)
+        n = rng.randint(1, 9)
+        nx_g = nx.gnm_random_graph(n, rng.randint(0, n*(n-1)//2 + 1), 
+                                   seed=seed)
+        g = tg.TinyGraph(n, np.int32)
+        for u, v in nx_g.edges():
+            nx_g[u][v]['weight'] = g[u, v] = rng.randint(1, 4)
+        graphs.append(g)
+        nodes = range(n)
+
+        np.testing.assert_allclose(
+            algs.get_laplacian(g), 
+            nx.laplacian_matrix(nx_g, nodelist=nodes).toarray())
+        np.testing.assert_allclose(
+            algs.get_laplacian(g, weighted=False), 
+            nx.laplacian_matrix(nx_g, nodelist=nodes, weight=None).toarray())
+        np.testing.assert_allclose(
+            algs.get_laplacian(g, 'normalized'), 
+            nx.normalized_laplacian_matrix(nx_g, nodelist=nodes).toarray(),
+            atol=1e-12)
+
+        a = nx.to_numpy_array(nx_g, nodelist=nodes)
+        d = a.sum(axis=1)
+        has_edges = d > 0
+        d[~has_edges] = 1
+        np.testing.assert_allclose(
+            algs.get_laplacian(g, 'random_walk'), 
+            (np.diag(has_edges) - a / d[:, None]))
+        np.testing.assert_allclose(algs.get_normalized_adjacency(g), 
+                                   a / np.sqrt(np.outer(d, d)))
+        a += np.eye(n)
+        d = a.sum(axis=1)
+        np.testing.assert_allclose(
+            algs.get_normalized_adjacency(g, self_loops=True), 
+            a / np.sqrt(np.outer(d, d)))
+
+    eigenvalues, eigenvectors = algs.get_laplacian_eigh_batch(graphs)
+    for g, values, vectors in zip(graphs, eigenvalues, eigenvectors):
+        laplacian = algs.get_laplacian(g, 'normalized')
+        np.testing.assert_allclose(laplacian @ vectors, vectors * values, 
+                                   atol=1e-10)
+        np.testing.assert_allclose(values, np.linalg.eigvalsh(laplacian),
+                                   atol=1e-10)
+
+    with pytest.raises(ValueError):
+        algs.get_laplacian(graphs[0], 'signless')
+    with pytest.raises(ValueError):
+        algs.get_laplacian_eigh_batch(graphs, 'random_walk')
+
+@pytest.mark.parametrize("kind", ['combinatorial', 'normalized'])
+def test_laplacian_eigsh(kind):
+    """
+    The sparse Lanczos eigenpairs match the dense ones.
+    """
+    pytest.importorskip("scipy")
+    g = tg.io.from_nx(nx.gnm_random_graph(300, 900, seed=1))
+    laplacian = algs.get_laplacian(g, kind)
+    values, vectors = algs.get_laplacian_eigsh(g, 4, kind)
+    np.testing.assert_allclose(values, np.linalg.eigvalsh(laplacian)[-4:])
+    np.testing.assert_allclose(laplacian @ vectors, vectors * values, 
+                               atol=1e-8)
+
+def test_laplacian_eigsh_without_scipy(monkeypatch):
+    """
+    A missing scipy is reported as an ImportError naming the function.
+    """
+    import sys
+    monkeypatch.setitem(sys.modules, 'scipy.sparse', None)
+    with pytest.raises(ImportError, match='get_laplacian_eigsh requires scipy'):
+        algs.get_laplacian_eigsh(tg.TinyGraph(5), 2)
+
+def aggregate_reference(g, x, op, weights):
+    """
+    Neighbor aggregation with a loop over the vertices.
+    """
+    out = np.zeros(x.shape)
+    for v in range(g.vert_N):
+        neighbors = np.flatnonzero(g.adjacency[v] != 0)
+        if len(neighbors) == 0:
+            continue
+        messages = x[neighbors]
+        if weights:
+            messages = messages * g.adjacency[v, neighbors].reshape(
+                (-1,) + (1,) * (x.ndim - 1))
+        out[v] = getattr(np, op)(messages, axis=0)
+    return out
+
+@pytest.mark.parametrize("op", ['sum', 'mean', 'max', 'min'])
+def test_aggregate(op):
+    """
+    Sparse and dense aggregation agree with a loop over the vertices, and 
+    the batch with the single graphs.
+    """
+    graphs = []
+    features = []
+    for seed in range(20):
+        rng = np.random.RandomState(seed)
+        n = rng.choice([0, 1, 5, 80, 300])
+        nx_g = nx.gnm_random_graph(n, rng.randint(0, max(1, n * 3)), 
+                                   seed=seed)
+        g = tg.TinyGraph(n, np.float32)
+        for u, v in nx_g.edges():
+            g[u, v] = rng.randint(1, 4)
+        x = rng.randn(n, 3, 2)
+        graphs.append(g)
+        features.append(x)
+
+        methods = ['auto', 'sparse'] + (['dense'] if op in ('sum', 'mean') 
+                                        else [])
+        for weights in [False, True]:
+            expected = aggregate_reference(g, x, op, weights)
+            for method in methods:
+                np.testing.assert_allclose(
+                    algs.aggregate(g, x, op, weights, method), expected,
+                    atol=1e-12)
+
+    for weights in [False, True]:
+        out, offsets = algs.aggregate_batch(graphs, np.concatenate(features),
+                                            op, weights)
+        for b, g in enumerate(graphs):
+            np.testing.assert_allclose(out[offsets[b]:offsets[b+1]], 
+                                       algs.aggregate(g, features[b], op, 
+                                                      weights),
+                                       atol=1e-12)
+
+def test_aggregate_errors():
+    """
+    Integer features give float64 results, and bad inputs raise.
+    """
+    g = tg.io.from_nx(nx.path_graph(3))
+    assert algs.aggregate(g, np.arange(3)).dtype == np.float64
+    np.testing.assert_array_equal(algs.aggregate(g, np.arange(3), 'mean'), 
+                                  [1, 1, 1])
+    with pytest.raises(ValueError):
+        algs.aggregate(g, np.arange(4))
+    with pytest.raises(ValueError):
+        algs.aggregate(g, np.arange(3), 'prod')
+    with pytest.raises(ValueError):
+        algs.aggregate(g, np.arange(3), 'max', method='dense')
@@ -0,0 +1,368 @@
+import tinygraph as tg
+import tinygraph.algorithms as algs
+from tinygraph.util import permute, graph_equality
+import pytest
+import itertools
+import graph_test_suite
+import networkx as nx
+import numpy as np
+
+suite = graph_test_suite.get_full_suite()
+
+def labeled_graph(nx_g, rng):
+    """
+    TinyGraph from nx_g with random vertex and edge labels.
+    """
+    g = tg.io.from_nx(nx_g, adj_type=np.int32)
+    g.add_vert_prop('elem', np.int32)
+    g.add_edge_prop('order', np.int32)
+    g.v['elem'][:] = rng.randint(3, size=g.vert_N)
+    for i, j in g.edges():
+        g.e['order'][i, j] = rng.randint(1, 3)
+    return g
+
+### Weisfeiler-Lehman ###
+
+@pytest.mark.parametrize("test_name", [k for k in suite.keys()])
+def test_wl_hash_permutation_invariant(test_name):
+    """
+    Permuting a graph does not change its WL hash or subtree features.
+    """
+    rng = np.random.RandomState(0)
+    for g in suite[test_name]:
+        perm = rng.permutation(g.vert_N)
+        h = permute(g, perm)
+        assert algs.get_wl_hash(g, weight=True) == \
+            algs.get_wl_hash(h, weight=True)
+        # vertex i of g is vertex perm[i] of h
+        np.testing.assert_array_equal(algs.get_wl_colors(g, 2), 
+                                      algs.get_wl_colors(h, 2)[:, perm])
+        f1, c1 = algs.get_wl_subtree_features(g)
+        f2, c2 = algs.get_wl_subtree_features(h)
+        np.testing.assert_array_equal(f1, f2)
+        np.testing.assert_array_equal(c1, c2)
+
+def test_wl_hash_labels():
+    """
+    Vertex and edge labels are part of the hash.
+    """
+    rng = np.random.RandomState(1)
+    g = labeled_graph(nx.cycle_graph(6), rng)
+    h = permute(g, rng.permutation(6))
+    for kw in [{}, {'vert_props' : ['elem']}, 
+               {'vert_props' : ['elem'], 'edge_props' : ['order']}]:
+        assert algs.get_wl_hash(g, **kw) == algs.get_wl_hash(h, **kw)
+
+    h = g.copy()
+    h.v['elem'][0] += 1
+    assert algs.get_wl_hash(g) == algs.get_wl_hash(h)
+    assert algs.get_wl_hash(g, vert_props=['elem']) != \
+        algs.get_wl_hash(h, vert_props=['elem'])
+
+    h = g.copy()
+    h.e['order'][0, 1] = 3 - h.e['order'][0, 1]
+    assert algs.get_wl_hash(g, vert_props=['elem']) == \
+        algs.get_wl_hash(h, vert_props=['elem'])
+    assert algs.get_wl_hash(g, edge_props=['order']) != \
+        algs.get_wl_hash(h, edge_props=['order'])
+
+def test_wl_hash_matches_nx():
+    """
+    Our hash separates small graphs exactly when the networkx WL hash does.
+    """
+    graphs = [ng for ng in nx.graph_atlas_g()[1:] if ng.order() <= 6]
+    nx_hashes = [nx.weisfeiler_lehman_graph_hash(ng, iterations=3) 
+                 for ng in graphs]
+    tg_hashes = algs.get_wl_hash_batch([tg.io.from_nx(ng) for ng in graphs], 
+                                       n_iter=4)
+    nx_classes = {}
+    tg_classes = {}
+    for i, (a, b) in enumerate(zip(nx_hashes, tg_hashes)):
+        nx_classes.setdefault(a, set()).add(i)
+        tg_classes.setdefault(b, set()).add(i)
+    assert sorted(map(sorted, nx_classes.values())) == \
+        sorted(map(sorted, tg_classes.values()))
+
+def test_wl_batch():
+    """
+    Batched hashes and features match the single graph versions.
+    """
+    rng = np.random.RandomState(2)
+    graphs = [labeled_graph(nx.gnm_random_graph(n, n + 3, seed=n), rng) 
+              for n in range(4, 15)]
+    graphs.insert(3, tg.TinyGraph(0, np.int32, {'elem' : np.int32}, 
+                                  {'order' : np.int32}))
+    kw = {'vert_props' : ['elem'], 'edge_props' : ['order']}
+
+    hashes = algs.get_wl_hash_batch(graphs, **kw)
+    assert list(hashes) == [algs.get_wl_hash(g, **kw) for g in graphs]
+
+    indptr, features, counts = algs.get_wl_subtree_features_batch(graphs, **kw)
+    for b, g in enumerate(graphs):
+        f, c = algs.get_wl_subtree_features(g, **kw)
+        np.testing.assert_array_equal(features[indptr[b]:indptr[b+1]], f)
+        np.testing.assert_array_equal(counts[indptr[b]:indptr[b+1]], c)
+        assert c.sum() == 4 * g.vert_N
+
+    indptr, features, counts = algs.get_wl_subtree_features_batch(
+        graphs, n_features=16, **kw)
+    assert features.max() < 16
+    for b, g in enumerate(graphs):
+        assert counts[indptr[b]:indptr[b+1]].sum() == 4 * g.vert_N
+        assert np.all(np.diff(features[indptr[b]:indptr[b+1]]) > 0)
+
+    assert len(algs.get_wl_hash_batch([], **kw)) == 0
+    indptr, features, counts = algs.get_wl_subtree_features_batch([], **kw)
+    assert list(indptr) == [0] and len(features) == len(counts) == 0
+
+### Canonical labeling ###
+
+def nx_orbits(nx_g):
+    """
+    Automorphism orbits by brute force, as the smallest vertex of each orbit.
+    """
+    nodes = list(nx_g.nodes())
+    orbits = np.arange(len(nodes))
+    matcher = nx.algorithms.isomorphism.GraphMatcher(nx_g, nx_g)
+    for m in matcher.isomorphisms_iter():
+        for a, b in m.items():
+            i, j = nodes.index(a), nodes.index(b)
+            orbits[i] = min(orbits[i], j)
+    return orbits
+
+def test_canonical_atlas():
+    """
+    All graphs with up to 6 vertices get distinct canonical hashes, permuted
+    copies get the same canonical form, and orbits match networkx.
+    """
+    rng = np.random.RandomState(3)
+    hashes = set()
+    atlas = [ng for ng in nx.graph_atlas_g() if ng.order() <= 6]
+    for nx_g in atlas:
+        g = tg.io.from_nx(nx_g)
+        h = permute(g, rng.permutation(g.vert_N))
+
+        g_perm, g_orbits = algs.get_canonical_labeling(g)
+        h_perm, _ = algs.get_canonical_labeling(h)
+        assert graph_equality(permute(g, g_perm), permute(h, h_perm))
+        np.testing.assert_array_equal(g_orbits, nx_orbits(nx_g))
+
+        assert algs.get_canonical_hash(g) == algs.get_canonical_hash(h)
+        hashes.add(algs.get_canonical_hash(g))
+    assert len(hashes) == len(atlas)
+
+@pytest.mark.parametrize("nx_g", [nx.petersen_graph(), nx.empty_graph(40),
+                                  nx.complete_graph(20), 
+                                  nx.hypercube_graph(5),
+                                  nx.grid_2d_graph(6, 6),
+                                  nx.random_regular_graph(3, 60, seed=1)])
+def test_canonical_symmetric(nx_g):
+    """
+    Highly symmetric graphs, where pruning by automorphisms matters.
+    """
+    rng = np.random.RandomState(4)
+    g = tg.io.from_nx(nx_g)
+    h = permute(g, rng.permutation(g.vert_N))
+    g_perm, g_orbits = algs.get_canonical_labeling(g)
+    h_perm, h_orbits = algs.get_canonical_labeling(h)
+    assert graph_equality(permute(g, g_perm), permute(h, h_perm))
+    assert len(set(g_orbits)) == len(set(h_orbits))
+
+def test_canonical_labels():
+    """
+    Vertex properties, edge properties and weights are respected.
+    """
+    rng = np.random.RandomState(5)
+    for seed in range(20):
+        g = labeled_graph(nx.gnm_random_graph(10, 14, seed=seed), rng)
+        g[0, 1] = 2
+        kw = {'vert_props' : ['elem'], 'edge_props' : ['order'], 
+              'weight' : True}
+        h = permute(g, rng.permutation(g.vert_N))
+
+        g_perm, _ = algs.get_canonical_labeling(g, **kw)
+        h_perm, _ = algs.get_canonical_labeling(h, **kw)
+        assert graph_equality(permute(g, g_perm), permute(h, h_perm))
+        assert algs.get_canonical_hash(g, **kw) == \
+            algs.get_canonical_hash(h, **kw)
+
+        h.v['elem'][0] += 5
+        assert algs.get_canonical_hash(g, **kw) != \
+            algs.get_canonical_hash(h, **kw)
+        assert algs.get_canonical_hash(g, edge_props=['order']) == \
+            algs.get_canonical_hash(h, edge_props=['order'])
+
+        # weights are ignored unless asked for, as in the WL hashes
+        h = permute(g, np.arange(g.vert_N))
+        h[0, 1] = 1
+        h = permute(h, rng.permutation(g.vert_N))
+        assert algs.get_canonical_hash(g) == algs.get_canonical_hash(h)
+        assert algs.get_canonical_hash(g, weight=True) != \
+            algs.get_canonical_hash(h, weight=True)
+
+    # a cycle whose vertex labels break all symmetry has trivial orbits
+    g = tg.TinyGraph(4, vp_types={'elem' : np.int32})
+    for i in range(4):
+        g[i, (i + 1) % 4] = 1
+    np.testing.assert_array_equal(algs.get_canonical_labeling(g)[1], 
+                                  [0, 0, 0, 0])
+    g.v['elem'][:] = [1, 2, 3, 4]
+    np.testing.assert_array_equal(
+        algs.get_canonical_labeling(g, vert_props=['elem'])[1], [0, 1, 2, 3])
+    g.v['elem'][:] = [1, 2, 1, 2]
+    np.testing.assert_array_equal(
+        algs.get_canonical_labeling(g, vert_props=['elem'])[1], [0, 1, 0, 1])
+
+### Subgraph matching ###
+
+def tg_to_nx(g):
+    """
+    networkx graph with the 'elem' and 'order' labels of a labeled_graph.
+    """
+    nx_g = nx.Graph()
+    for i in range(g.vert_N):
+        nx_g.add_node(i, elem=g.v['elem'][i])
+    for i, j in g.edges():
+        nx_g.add_edge(i, j, order=g.e['order'][i, j])
+    return nx_g
+
+@pytest.mark.parametrize("induced", [False, True])
+def test_subgraph_matches_nx(induced):
+    """
+    Match counts and matches agree with networkx, with and without labels.
+    """
+    rng = np.random.RandomState(3)
+    for seed in range(40):
+        t = labeled_graph(nx.gnm_random_graph(10, 16, seed=seed), rng)
+        p = labeled_graph(nx.gnm_random_graph(4, rng.randint(2, 5), 
+                                              seed=seed + 100), rng)
+        for kw, node_match, edge_match in [
+                ({}, None, None),
+                ({'vert_props' : ['elem'], 'edge_props' : ['order']}, 
+                 lambda a, b: a['elem'] == b['elem'], 
+                 lambda a, b: a['order'] == b['order'])]:
+            matcher = nx.algorithms.isomorphism.GraphMatcher(
+                tg_to_nx(t), tg_to_nx(p), node_match=node_match, 
+                edge_match=edge_match)
+            if induced:
+                expected = matcher.subgraph_isomorphisms_iter()
+            else:
+                expected = matcher.subgraph_monomorphisms_iter()
+            expected = sorted(tuple(sorted(m, key=m.get)) for m in expected)
+
+            matches = algs.find_subgraph_matches(p, t, 'all', induced=induced,
+                                                 **kw)
+            assert sorted(map(tuple, matches)) == expected
+            assert algs.find_subgraph_matches(p, t, 'count', induced=induced,
+                                              **kw) == len(expected)
+            first = algs.find_subgraph_matches(p, t, 'first', induced=induced,
+                                               **kw)
+            if len(expected) == 0:
+                assert first is None
+            else:
+                assert tuple(first) in expected
+
+def test_subgraph_matches_special():
+    """
+    Empty patterns, too large patterns and weights.
+    """
+    t = tg.io.from_nx(nx.cycle_graph(6), adj_type=np.int32)
+    assert algs.find_subgraph_matches(tg.TinyGraph(0), t, 'count') == 1
+    assert algs.find_subgraph_matches(t, tg.TinyGraph(3), 'first') is None
+    assert algs.find_subgraph_matches(t, t, 'count') == 12
+    assert algs.find_subgraph_matches(
+        tg.io.from_nx(nx.path_graph(6), adj_type=np.int32), t, 'count', 
+        induced=True) == 0
+
+    p = tg.io.from_nx(nx.path_graph(2), adj_type=np.int32)
+    p[0, 1] = 2
+    assert algs.find_subgraph_matches(p, t, 'count') == 12
+    assert algs.find_subgraph_matches(p, t, 'count', weight=True) == 0
+    t[2, 3] = 2
+    np.testing.assert_array_equal(
+        np.sort(algs.find_subgraph_matches(p, t, 'all', weight=True), axis=0),
+        [[2, 2], [3, 3]])
+
+    with pytest.raises(ValueError):
+        algs.find_subgraph_matches(p, t, 'some')
+
+def test_subgraph_matches_batch():
+    """
+    Batch matching agrees with matching every target on its own.
+    """
+    rng = np.random.RandomState(4)
+    targets = [labeled_graph(nx.gnm_random_graph(rng.randint(3, 10), 12, 
+                                                 seed=s), rng) 
+               for s in range(30)]
+    p = labeled_graph(nx.path_graph(3), rng)
+    kw = {'vert_props' : ['elem'], 'edge_props' : ['order']}
+
+    counts = algs.find_subgraph_matches_batch(p, targets, 'count', **kw)
+    found = algs.find_subgraph_matches_batch(p, targets, 'first', **kw)
+    matches = algs.find_subgraph_matches_batch(p, targets, 'all', **kw)
+    for b, t in enumerate(targets):
+        expected = algs.find_subgraph_matches(p, t, 'count', **kw)
+        assert counts[b] == expected
+        assert found[b] == (expected > 0)
+        assert len(matches[b]) == expected
+    assert 0 < found.sum() < len(targets)
+
+### Graphlets ###
+
+def brute_force_orbits(nx_g):
+    """
+    Graphlet orbits by checking every set of three and four vertices.
+    """
+    orbits = np.zeros((nx_g.number_of_nodes(), 15), dtype=np.int64)
+    for v in nx_g:
+        orbits[v, 0] = nx_g.degree(v)
+    for k in [3, 4]:
+        for vertices in itertools.combinations(nx_g.nodes(), k):
+            h = nx_g.subgraph(vertices)
+            if not nx.is_connected(h):
+                continue
+            edges = h.number_of_edges()
+            max_deg = max(d for _, d in h.degree())
+            for v, d in h.degree():
+                if k == 3:
+                    orbit = 3 if edges == 3 else d
+                elif edges == 3 and max_deg == 3:
+                    orbit = 6 if d == 1 else 7
+                elif edges == 3:
+                    orbit = 3 + d
+                elif edges == 4:
+                    orbit = 8 + d if max_deg == 3 else 8
+                else:
+                    orbit = 10 + d if edges == 5 else 14
+                orbits[v, orbit] += 1
+    return orbits
+
+def test_graphlet_orbits():
+    """
+    Orbits agree with brute force, counts follow from them, and the batch 
+    gives the same results.
+    """
+    graphs = []
+    for seed in range(50):
+        rng = np.random.RandomState(seed)
+        n = rng.randint(0, 10)
+        nx_g = nx.gnm_random_graph(n, rng.randint(0, n*(n-1)//2 + 1), 
+                                   seed=seed)
+        g = tg.io.from_nx(nx_g)
+        graphs.append(g)
+        np.testing.assert_array_equal(algs.get_graphlet_orbits(g), 
+                                      brute_force_orbits(nx_g))
+
+    offsets, orbits, counts = algs.get_graphlet_orbits_batch(graphs)
+    for b, g in enumerate(graphs):
+        np.testing.assert_array_equal(orbits[offsets[b]:offsets[b+1]], 
+                                      algs.get_graphlet_orbits(g))
+        np.testing.assert_array_equal(counts[b], algs.get_graphlet_counts(g))
+
+    for nx_g, expected in [
+            (nx.complete_graph(5), [10, 0, 10, 0, 0, 0, 0, 0, 5]),
+            (nx.cycle_graph(5), [5, 5, 0, 5, 0, 0, 0, 0, 0]),
+            (nx.star_graph(4), [4, 6, 0, 0, 4, 0, 0, 0, 0]),
+            (nx.cycle_graph(4), [4, 4, 0, 0, 0, 1, 0, 0, 0])]:
+        np.testing.assert_array_equal(
+            algs.get_graphlet_counts(tg.io.from_nx(nx_g)), expected)
@@ -52,3 +52,85 @@ def test_read_broken_bin():
     # here to make sure it works
     g = tg.io.from_binary(io.BytesIO(broken_binary))
 
+
+
+def test_edge_index():
+    """
+    to_edge_index agrees with TinyGraph.edges() on every graph of the suite,
+    both for single graphs and for the whole suite as one batch.
+    """
+    graphs = [g for name in suite.keys() for g in suite[name]]
+
+    for g in graphs[:200]:
+        edge_index, edge_attr, x, batch = tg.io.to_edge_index(
+            g, vert_props=[], edge_props=[], weight=True, symmetric=False,
+            dtype=np.float64)
+        edges = g.edges(weight=True)
+        assert edge_index.dtype == np.int64
+        assert edge_index.shape == (2, len(edges))
+        assert [(int(i), int(j)) for i, j in edge_index.T] == \
+            [(int(e[0]), int(e[1])) for e in edges]
+        np.testing.assert_array_equal(edge_attr[:, 0], 
+                                      [float(e[2]) for e in edges])
+        assert x.shape == (g.vert_N, 0)
+        np.testing.assert_array_equal(batch, np.zeros(g.vert_N))
+
+    edge_index, edge_attr, x, batch = tg.io.to_edge_index(
+        graphs, vert_props=[], edge_props=[])
+    assert edge_index.shape[1] == 2*sum(len(g.edges()) for g in graphs)
+    assert len(batch) == sum(g.vert_N for g in graphs)
+    # Every edge stays within its own graph
+    assert np.array_equal(batch[edge_index[0]], batch[edge_index[1]])
+
+
+def test_edge_index_props():
+    """
+    Vertex and edge properties become feature columns in order.
+    """
+    g1 = tg.TinyGraph(3, np.int32, vp_types={'a': np.int32,
+                                             'b': np.dtype((np.float32, 2))},
+                      ep_types={'c': np.float32})
+    g1[0, 1] = 2
+    g1[1, 2] = 1
+    g1.e['c'][0, 1] = 0.5
+    g1.e['c'][1, 2] = 0.25
+    g1.v['a'][:] = [1, 2, 3]
+    g1.v['b'][:] = [[1, 2], [3, 4], [5, 6]]
+    g2 = tg.util.permute(g1, [2, 0, 1])
+
+    edge_index, edge_attr, x, batch = tg.io.to_edge_index([g1, g2], 
+                                                          weight=True)
+    np.testing.assert_array_equal(edge_index, 
+                                  [[0, 1, 1, 2, 3, 3, 4, 5],
+                                   [1, 0, 2, 1, 4, 5, 3, 3]])
+    np.testing.assert_array_equal(edge_attr, 
+                                  [[2, 0.5], [2, 0.5], [1, 0.25], [1, 0.25],
+                                   [1, 0.25], [2, 0.5], [1, 0.25], [2, 0.5]])
+    np.testing.assert_array_equal(x[:3], [[1, 1, 2], [2, 3, 4], [3, 5, 6]])
+    np.testing.assert_array_equal(x[3:], [[2, 3, 4], [3, 5, 6], [1, 1, 2]])
+    np.testing.assert_array_equal(batch, [0, 0, 0, 1, 1, 1])
+    assert x.dtype == np.float32 and edge_attr.dtype == np.float32
+
+
+def test_edge_index_empty_graphs():
+    """
+    Graphs without vertices contribute nothing, with every property type.
+    """
+    ep = {'c': np.float32, 'd': np.dtype((np.int32, 2))}
+    vp = {'a': np.dtype((np.float32, 3))}
+    g1 = tg.TinyGraph(2, np.int32, vp_types=vp, ep_types=ep)
+    g1[0, 1] = 1
+    g1.e['c'][0, 1] = 0.5
+    g1.e['d'][0, 1] = [1, 2]
+    g1.v['a'][:] = [[1, 2, 3], [4, 5, 6]]
+    g0 = tg.TinyGraph(0, np.int32, vp_types=vp, ep_types=ep)
+
+    edge_index, edge_attr, x, batch = tg.io.to_edge_index([g0, g1, g0])
+    np.testing.assert_array_equal(edge_index, [[0, 1], [1, 0]])
+    np.testing.assert_array_equal(edge_attr, [[0.5, 1, 2], [0.5, 1, 2]])
+    np.testing.assert_array_equal(x, [[1, 2, 3], [4, 5, 6]])
+    np.testing.assert_array_equal(batch, [1, 1])
+
+    edge_index, edge_attr, x, batch = tg.io.to_edge_index(g0)
+    assert edge_index.shape == (2, 0) and edge_attr.shape == (0, 3)
+    assert x.shape == (0, 3) and batch.shape == (0,)
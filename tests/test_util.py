@@ -116,6 +116,46 @@ def test_permute_dict():
 
     assert list(h.v['name']) == ['d', 'c', 'a', 'b']
 
+@pytest.mark.parametrize("test_name", [k for k in suite.keys()])
+def test_permute_inplace_suite(test_name):
+    """
+    Permuting in place gives the same graph as permuting into a copy, and
+    returns the original object.
+    """
+    rng = np.random.RandomState(0)
+
+    for g in suite[test_name]:
+        perm = rng.permutation(g.vert_N)
+        h = permute(g, perm)
+
+        g2 = tg.util.permute(g, np.arange(g.vert_N))
+        version = g2._version
+        g3 = permute(g2, perm, inplace=True)
+        assert g3 is g2
+        assert graph_equality(g3, h)
+        assert g2._version != version or g.vert_N == 0
+
+def test_permute_zero_props():
+    """
+    All-zero properties, which the relabeling skips, stay zero next to
+    properties that are populated.
+    """
+    g = tg.TinyGraph(6, np.int32,
+                     vp_types = {'a' : np.int32, 'b' : np.float64},
+                     ep_types = {'c' : np.int32, 'd' : np.bool_})
+    g[0, 5] = 3
+    g[1, 2] = 1
+    g.v['a'][:] = np.arange(6)
+    g.e['c'][0, 5] = 7
+    perm = [5, 3, 1, 0, 2, 4]
+
+    for h in [permute(g, perm), permute(permute(g, np.arange(6)), perm, 
+                                        inplace=True)]:
+        assert h[5, 4] == 3 and h[3, 1] == 1 and h.edge_N == 2
+        assert h.e['c'][5, 4] == 7 and h.e_p['c'].sum() == 14
+        np.testing.assert_array_equal(h.v['a'], np.argsort(perm))
+        assert not np.any(h.v['b']) and not np.any(h.e_p['d'])
+
 @pytest.mark.parametrize("test_name", [k for k in suite.keys()])
 def test_permutation_inversion_suite(test_name):
     """Use the graph suite to permute and un-permute a graph"""
@@ -418,3 +458,136 @@ def test_permute_multi_dtype_hard_graph():
     
         
 
+
+@pytest.mark.parametrize("test_name", [k for k in suite.keys()])
+def test_merge_all_suite(test_name):
+    """
+    merge_all over a list of graphs equals chaining pairwise merges.
+    """
+    from tinygraph.util import merge_all
+
+    graphs = suite[test_name]
+    if len(graphs) == 0:
+        return
+    expected = graphs[0]
+    for g in graphs[1:]:
+        expected = merge(expected, g)
+    assert graph_equality(merge_all(graphs), expected)
+    assert graph_equality(merge_all(graphs[:1]), graphs[0])
+
+def test_merge_all_schemas():
+    """
+    merge_all fills missing properties with zeros, favors earlier graph props
+    and checks dtypes across every graph.
+    """
+    from tinygraph.util import merge_all
+
+    g1 = tg.TinyGraph(2, np.int32, vp_types={'a': np.int32})
+    g2 = tg.TinyGraph(3, np.int32, ep_types={'b': np.float64})
+    g3 = tg.TinyGraph(1, np.int32, vp_types={'a': np.int32})
+    g1[0, 1] = 2
+    g1.v['a'][:] = [4, 5]
+    g2[1, 2] = 3
+    g2.e['b'][1, 2] = 0.5
+    g3.v['a'][:] = [6]
+    g1.props = {'name': 'g1'}
+    g2.props = {'name': 'g2', 'other': 1}
+
+    with pytest.warns(UserWarning):
+        gg = merge_all([g1, g2, g3])
+    assert gg.vert_N == 6 and gg.edge_N == 2
+    assert gg[0, 1] == 2 and gg[3, 4] == 3
+    assert gg.e['b'][3, 4] == 0.5
+    np.testing.assert_array_equal(gg.v['a'], [4, 5, 0, 0, 0, 6])
+    assert gg.props == {'name': 'g1', 'other': 1}
+
+    with pytest.raises(TypeError):
+        merge_all([g1, g2, tg.TinyGraph(2, np.float32)])
+    with pytest.raises(TypeError):
+        merge_all([g1, g2, tg.TinyGraph(2, np.int32, 
+                                         vp_types={'a': np.float32})])
+    with pytest.raises(ValueError):
+        merge_all([])
+
+
+### Map graphs ###
+
+@pytest.mark.parametrize("workers", [None, 1, 4])
+def test_map_graphs(workers):
+    """
+    map_graphs returns the same results, in order, as a plain loop.
+    """
+    import tinygraph.algorithms as algs
+    from tinygraph.util import map_graphs
+
+    graphs = [g for name in list(suite.keys())[:10] for g in suite[name]]
+    expected = [algs.get_connected_components(g) for g in graphs]
+    assert map_graphs(algs.get_connected_components, graphs, 
+                      workers=workers) == expected
+
+    expected = [algs.get_shortest_paths(g, False) for g in graphs]
+    result = map_graphs(lambda g: algs.get_shortest_paths(g, False), graphs,
+                        workers=workers)
+    for r, e in zip(result, expected):
+        np.testing.assert_array_equal(r, e)
+
+
+### Collate ###
+
+def test_collate():
+    """
+    collate pads every graph into the same arrays that a per-graph copy gives.
+    """
+    from tinygraph.util import collate
+
+    rng = np.random.default_rng(0)
+    graphs = []
+    for N in [3, 0, 7, 5]:
+        g = tg.TinyGraph(N, np.int32, vp_types={'a': np.int32, 
+                                                'b': np.dtype((np.float32, 2))},
+                         ep_types={'c': np.float64})
+        for i in range(N):
+            g.v['a'][i] = rng.integers(10)
+            g.v['b'][i] = rng.random(2)
+            for j in range(i+1, N):
+                if rng.random() < 0.5:
+                    g[i, j] = rng.integers(1, 5)
+                    g.e['c'][i, j] = rng.random()
+        graphs.append(g)
+
+    adj, vf, ef, mask = collate(graphs)
+    assert adj.shape == (4, 7, 7) and adj.dtype == np.int32
+    assert vf.shape == (4, 7, 3) and vf.dtype == np.float32
+    assert ef.shape == (4, 7, 7, 1)
+    np.testing.assert_array_equal(mask.sum(axis=1), [3, 0, 7, 5])
+    for b, g in enumerate(graphs):
+        N = g.vert_N
+        np.testing.assert_array_equal(adj[b, :N, :N], g.adjacency)
+        assert np.all(adj[b, N:] == 0) and np.all(adj[b, :, N:] == 0)
+        np.testing.assert_array_equal(vf[b, :N, 0], g.v['a'])
+        np.testing.assert_array_equal(vf[b, :N, 1:], g.v['b'])
+        assert np.all(vf[b, N:] == 0)
+        np.testing.assert_allclose(ef[b, :N, :N, 0], g.e_p['c'], rtol=1e-6)
+
+    adj, vf, ef, mask = collate(graphs, vert_props=['b'], edge_props=[], 
+                                n_max=9, dtype=np.float64)
+    assert adj.shape == (4, 9, 9) and vf.shape == (4, 9, 2) 
+    assert ef.shape == (4, 9, 9, 0)
+    np.testing.assert_array_equal(vf[2, :7], graphs[2].v['b'])
+
+    with pytest.raises(ValueError):
+        collate(graphs, n_max=5)
+
+def test_bucket_by_size():
+    """
+    Buckets cover every graph once, respect batch_size and keep sizes close.
+    """
+    from tinygraph.util import bucket_by_size
+
+    graphs = [tg.TinyGraph(N) for N in [5, 1, 9, 3, 5, 2, 8, 1]]
+    for rng in [None, np.random.default_rng(1)]:
+        batches = bucket_by_size(graphs, 3, rng)
+        assert sorted(np.concatenate(batches)) == list(range(len(graphs)))
+        assert all(len(b) <= 3 for b in batches)
+        sizes = sorted([sorted(graphs[i].vert_N for i in b) for b in batches])
+        assert sizes == [[1, 1, 2], [3, 5, 5], [8, 9]]
@@ -3,12 +3,29 @@
 import tinygraph
 import tinygraph.fastutils
 from queue import Queue
+import hashlib
+from copy import deepcopy
 
 import numpy as np
 
-from tinygraph.fastutils import get_connected_components
+from tinygraph.fastutils import get_connected_components, get_component_labels
+from tinygraph.fastutils import get_neighbor_index, NeighborIndex
+from tinygraph.fastutils import get_neighbor_index_batch
 from tinygraph.fastutils import get_shortest_paths
+from tinygraph.fastutils import get_shortest_paths_batch
+from tinygraph.fastutils import update_shortest_paths
 from tinygraph.fastutils import construct_all_shortest_paths
+from tinygraph.fastutils import canonical_search
+from tinygraph.fastutils import subgraph_match
+from tinygraph.fastutils import brandes
+from tinygraph.fastutils import tarjan_biconnected
+from tinygraph.fastutils import kruskal
+from tinygraph.fastutils import k_hop
+from tinygraph.fastutils import random_walks
+from tinygraph.fastutils import triangles_sparse
+from tinygraph.fastutils import graphlet4_orbits
+from tinygraph.fastutils import distance_descriptors
+from tinygraph.fastutils import single_source_distances
 
 def is_connected(tg):
     """
@@ -20,7 +37,105 @@ def is_connected(tg):
     Outputs:
         connected (bool): whether the graph is fully connected.
     """
-    return len(get_connected_components(tg)) == 1
+    return get_connectivity(tg).component_N == 1
+
+class DynamicConnectivity:
+    """
+    Connected components of a graph kept up to date as edges are added. 
+    Edge insertions through TinyGraph.__setitem__ are merged into a 
+    union-find structure right away; edge deletions and any other change mark
+    it stale, and it is rebuilt from the graph on the next get_connectivity.
+    Use get_connectivity to get the up to date instance of a graph.
+    """
+
+    def __init__(self, tg):
+        labels = get_component_labels(tg)
+        # the smallest vertex of every component is its representative, and
+        # every vertex points straight at it
+        roots = np.full(labels.max() + 1 if len(labels) else 0, -1)
+        roots[labels[::-1]] = np.arange(tg.vert_N)[::-1]
+        self._parent = roots[labels].tolist()
+        sizes = np.bincount(labels)
+        self._size = [0] * tg.vert_N
+        for r, n in zip(roots, sizes):
+            self._size[r] = int(n)
+        self.component_N = len(roots)
+        self.stale = False
+        self.version = tg._version
+
+    def _find(self, v):
+        parent = self._parent
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+
+    def _union(self, a, b):
+        a = self._find(a)
+        b = self._find(b)
+        if a == b:
+            return
+        if self._size[a] < self._size[b]:
+            a, b = b, a
+        self._parent[b] = a
+        self._size[a] += self._size[b]
+        self.component_N -= 1
+
+    def _edge_changed(self, tg, e1, e2, was_edge, is_edge):
+        """
+        Called by TinyGraph.__setitem__ after it has changed an edge.
+        """
+        if self.version != tg._version - 1:
+            return
+        if is_edge:
+            self._union(e1, e2)
+        elif was_edge:
+            self.stale = True
+        self.version = tg._version
+
+    def same_component(self, a, b):
+        """
+        Whether vertices a and b are connected.
+        """
+        return self._find(a) == self._find(b)
+
+    def component_size(self, v):
+        """
+        Number of vertices in the component of v.
+        """
+        return self._size[self._find(v)]
+
+    def get_component_labels(self):
+        """
+        Component of every vertex, numbered in order of their smallest vertex
+        as in get_component_labels.
+        """
+        roots = np.array([self._find(v) for v in range(len(self._parent))],
+                         dtype=np.int32)
+        _, first, labels = np.unique(roots, return_index=True, 
+                                     return_inverse=True)
+        return np.argsort(np.argsort(first)).astype(np.int32)[labels]
+
+def get_connectivity(tg):
+    """
+    Get the DynamicConnectivity of a graph, rebuilding it only if the graph
+    has changed in a way it could not follow (edge deletions, vertex changes,
+    direct writes to the adjacency matrix followed by invalidate_caches). 
+    After the first call, is_connected and component queries on a graph 
+    that only gains edges take near constant time.
+
+    Inputs:
+        tg (TinyGraph): graph to get the connectivity of.
+
+    Outputs:
+        connectivity (DynamicConnectivity): connectivity of tg, attached to 
+            tg and updated by its edge insertions.
+    """
+    conn = tg._connectivity
+    if conn is None or conn.stale or conn.version != tg._version:
+        conn = DynamicConnectivity(tg)
+        tg._connectivity = conn
+    return conn
 
 def get_min_cycles(tg):
     """
@@ -59,4 +174,1609 @@ def get_min_cycles(tg):
                     cc = new_path
                     cycle_found = True
         cycles.append(cc)
-    return cycles
\ No newline at end of file
+    return cycles
+
+### Weisfeiler-Lehman color refinement ###
+
+_MIX_C1 = np.uint64(0xbf58476d1ce4e5b9)
+_MIX_C2 = np.uint64(0x94d049bb133111eb)
+_WL_SEED = np.uint64(0x9e3779b97f4a7c15)
+
+def _mix64(x):
+    """
+    splitmix64 finalizer, applied elementwise to a uint64 array.
+    """
+    with np.errstate(over='ignore'):
+        x = (x ^ (x >> np.uint64(30))) * _MIX_C1
+        x = (x ^ (x >> np.uint64(27))) * _MIX_C2
+        return x ^ (x >> np.uint64(31))
+
+def _hash_rows(values, h):
+    """
+    Fold the raw bytes of each row of values (any fixed-size dtype, with any
+    trailing shape) into the uint64 hashes h. Hashes depend only on the 
+    values, so they agree across graphs.
+    """
+    M = values.shape[0]
+    row_size = int(np.prod(values.shape[1:])) * values.dtype.itemsize
+    raw = np.ascontiguousarray(values).view(np.uint8).reshape(M, row_size)
+    pad = (-raw.shape[1]) % 8
+    if pad:
+        raw = np.concatenate([raw, np.zeros((M, pad), dtype=np.uint8)], axis=1)
+    words = raw.view(np.uint64)
+    for k in range(words.shape[1]):
+        h = _mix64(h ^ words[:, k])
+    return h
+
+def _segment_sums(x, offsets):
+    """
+    Sum x (uint64, wrapping) over the segments offsets[i]:offsets[i+1], 
+    giving 0 for empty segments.
+    """
+    with np.errstate(over='ignore'):
+        cs = np.zeros(len(x) + 1, dtype=np.uint64)
+        np.cumsum(x, out=cs[1:])
+        return cs[offsets[1:]] - cs[offsets[:-1]]
+
+def _wl_refine(graphs, index, n_iter, vert_props, edge_props, weight):
+    """
+    Run WL color refinement on the union of graphs described by index. 
+    Returns a (n_iter + 1) x vert_N uint64 array of the colors after each 
+    iteration.
+    """
+    N = index.vert_N
+    colors = np.empty((n_iter + 1, N), dtype=np.uint64)
+    if len(graphs) == 0:
+        return colors
+
+    h = np.full(N, _WL_SEED, dtype=np.uint64)
+    for p in vert_props:
+        values = np.concatenate([g.v[p] for g in graphs])
+        h = _hash_rows(values, h)
+    colors[0] = _mix64(h)
+
+    degrees = np.diff(index.offsets)
+    arc_labels = np.full(len(index.indices), _WL_SEED, dtype=np.uint64)
+    if weight:
+        arc_labels = _hash_rows(index.weights, arc_labels)
+    for p in edge_props:
+        values = []
+        for g in graphs:
+            gi = get_neighbor_index(g)
+            rows = np.repeat(np.arange(g.vert_N), np.diff(gi.offsets))
+            values.append(g.e_p[p][rows, gi.indices])
+        arc_labels = _hash_rows(np.concatenate(values), arc_labels)
+    arc_labels = _mix64(arc_labels)
+
+    offsets = index.offsets.astype(np.int64)
+    with np.errstate(over='ignore'):
+        for it in range(n_iter):
+            # hash each (neighbor color, edge label) pair, then combine the
+            # multiset of pairs with an order-independent sum
+            pairs = _mix64(colors[it][index.indices] * _MIX_C1 + arc_labels)
+            neighborhood = _segment_sums(pairs, offsets)
+            colors[it + 1] = _mix64(colors[it] * _MIX_C2 ^ 
+                                    _mix64(neighborhood + degrees.astype(np.uint64)))
+    return colors
+
+def get_wl_colors(tg, n_iter=3, vert_props=[], edge_props=[], weight=False):
+    """
+    Weisfeiler-Lehman color refinement. Each vertex starts with a color 
+    hashed from its vertex properties and at every iteration is recolored by
+    hashing its color together with the multiset of (color, edge label) of its
+    neighbors, where edge labels hash the requested edge properties. Colors
+    are hashes of the values, so they are comparable across graphs.
+
+    Inputs:
+        tg (TinyGraph): graph to refine.
+        n_iter (int): number of refinement iterations.
+        vert_props ([str]): vertex properties for the initial colors.
+        edge_props ([str]): edge properties used as edge labels.
+        weight (bool): whether to include the edge weight in the edge labels.
+
+    Outputs:
+        colors (np array): (n_iter + 1) x vert_N uint64 array, colors[k] are 
+            the vertex colors after k iterations.
+    """
+    index = get_neighbor_index(tg)
+    return _wl_refine([tg], index, n_iter, vert_props, edge_props, weight)
+
+def _wl_graph_hashes(colors, graph_offsets):
+    offsets = graph_offsets.astype(np.int64)
+    sizes = np.diff(offsets).astype(np.uint64)
+    h = _mix64(sizes ^ _WL_SEED)
+    with np.errstate(over='ignore'):
+        for it in range(colors.shape[0]):
+            h = _mix64(h * _MIX_C1 + _segment_sums(_mix64(colors[it]), offsets))
+    return h
+
+def get_wl_hash(tg, n_iter=3, vert_props=[], edge_props=[], weight=False):
+    """
+    Permutation-invariant Weisfeiler-Lehman hash of a graph, from the 
+    multisets of its vertex colors after every refinement iteration (see 
+    get_wl_colors). Isomorphic graphs always have equal hashes; graphs that
+    WL cannot distinguish (e.g. some regular graphs) collide as well.
+
+    Inputs:
+        tg (TinyGraph): graph to hash.
+        n_iter, vert_props, edge_props, weight: as in get_wl_colors.
+
+    Outputs:
+        hash (int): 64-bit graph hash.
+    """
+    return int(get_wl_hash_batch([tg], n_iter, vert_props, edge_props, 
+                                 weight)[0])
+
+def get_wl_hash_batch(graphs, n_iter=3, vert_props=[], edge_props=[], 
+                      weight=False):
+    """
+    get_wl_hash for many graphs, refining all of them in one pass over their
+    batched neighbor index.
+
+    Inputs:
+        graphs ([TinyGraph]): graphs to hash.
+        n_iter, vert_props, edge_props, weight: as in get_wl_colors.
+
+    Outputs:
+        hashes (np array): uint64 hash of every graph.
+    """
+    graphs = list(graphs)
+    index = get_neighbor_index_batch(graphs)
+    colors = _wl_refine(graphs, index, n_iter, vert_props, edge_props, weight)
+    return _wl_graph_hashes(colors, index.graph_offsets)
+
+def get_wl_subtree_features(tg, n_iter=3, vert_props=[], edge_props=[], 
+                            weight=False):
+    """
+    Sparse Weisfeiler-Lehman subtree feature vector of a graph: how often each
+    color appears over all refinement iterations (see get_wl_colors). The dot
+    product of two such vectors is the WL subtree kernel.
+
+    Inputs:
+        tg (TinyGraph): graph to featurize.
+        n_iter, vert_props, edge_props, weight: as in get_wl_colors.
+
+    Outputs:
+        features (np array): sorted uint64 colors present in the graph.
+        counts (np array): int64 number of occurrences of each color.
+    """
+    colors = get_wl_colors(tg, n_iter, vert_props, edge_props, weight)
+    return np.unique(colors, return_counts=True)
+
+def get_wl_subtree_features_batch(graphs, n_iter=3, vert_props=[], 
+                                  edge_props=[], weight=False, 
+                                  n_features=None):
+    """
+    get_wl_subtree_features for many graphs, as one sparse matrix in CSR 
+    layout (e.g. for scipy.sparse.csr_matrix((counts, features, indptr))).
+
+    Inputs:
+        graphs ([TinyGraph]): graphs to featurize.
+        n_iter, vert_props, edge_props, weight: as in get_wl_colors.
+        n_features (int): if given, fold colors into n_features columns 
+            (colors modulo n_features), otherwise features are the raw colors.
+
+    Outputs:
+        indptr (np array): int64, the features of graph b are 
+            features[indptr[b]:indptr[b+1]].
+        features (np array): sorted feature ids of each graph (uint64 colors,
+            or int64 columns with n_features).
+        counts (np array): int64 count of each feature.
+    """
+    graphs = list(graphs)
+    index = get_neighbor_index_batch(graphs)
+    colors = _wl_refine(graphs, index, n_iter, vert_props, edge_props, weight)
+
+    sizes = np.diff(index.graph_offsets)
+    graph_ids = np.tile(np.repeat(np.arange(len(graphs)), sizes), n_iter + 1)
+    features = colors.ravel()
+    if n_features is not None:
+        features = (features % np.uint64(n_features)).astype(np.int64)
+
+    # sort by (graph, feature) and run-length encode
+    order = np.lexsort((features, graph_ids))
+    graph_ids = graph_ids[order]
+    features = features[order]
+    new_run = np.ones(len(features), dtype=bool)
+    new_run[1:] = (graph_ids[1:] != graph_ids[:-1]) | \
+        (features[1:] != features[:-1])
+    starts = np.flatnonzero(new_run)
+    counts = np.diff(np.append(starts, len(features)))
+
+    indptr = np.zeros(len(graphs) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(graph_ids[starts], minlength=len(graphs)), 
+              out=indptr[1:])
+    return indptr, features[starts], counts
+
+
+### Canonical labeling ###
+
+def _row_bytes(arrays, M):
+    """
+    Raw bytes of each of the M rows of arrays, side by side, as an M x k 
+    uint8 array.
+    """
+    cols = [np.zeros((M, 0), dtype=np.uint8)]
+    for a in arrays:
+        row_size = int(np.prod(a.shape[1:])) * a.dtype.itemsize
+        cols.append(np.ascontiguousarray(a).view(np.uint8).reshape(M, row_size))
+    return np.concatenate(cols, axis=1)
+
+def _exact_ranks(raw):
+    """
+    Rank the rows of raw by their bytes, so equal rows get equal ranks.
+    """
+    if raw.shape[1] == 0:
+        return np.zeros(raw.shape[0], dtype=np.int32)
+    _, ranks = np.unique(raw, axis=0, return_inverse=True)
+    return ranks.reshape(-1).astype(np.int32)
+
+def _canonical_input(tg, vert_props, edge_props, weight):
+    index = get_neighbor_index(tg)
+    rows = np.repeat(np.arange(tg.vert_N), index.degrees)
+    cols = index.indices
+
+    vert_raw = _row_bytes([tg.v[p] for p in vert_props], tg.vert_N)
+    arc_values = [tg.e_p[p][rows, cols] for p in edge_props]
+    if weight:
+        arc_values.insert(0, index.weights)
+    arc_raw = _row_bytes(arc_values, len(cols))
+
+    labels = np.zeros((tg.vert_N, tg.vert_N), dtype=np.int32)
+    labels[rows, cols] = _exact_ranks(arc_raw) + 1
+    return index, rows, cols, labels, vert_raw, arc_raw
+
+def get_canonical_labeling(tg, vert_props=[], edge_props=[], weight=False):
+    """
+    Canonical labeling of a graph by partition refinement and a pruned 
+    search tree. Relabeling two isomorphic graphs (respecting the chosen 
+    properties) with their canonical permutations gives identical graphs.
+
+    Inputs:
+        tg (TinyGraph): graph to label.
+        vert_props ([str]): vertex properties an isomorphism must preserve.
+        edge_props ([str]): edge properties an isomorphism must preserve.
+        weight (bool): whether an isomorphism must preserve edge weights.
+
+    Outputs:
+        perm (np array): canonical permutation, such that 
+            util.permute(tg, perm) is the canonical form of tg.
+        orbits (np array): the automorphism orbit of each vertex, given by the
+            smallest vertex in the orbit.
+    """
+    index, _, _, labels, vert_raw, _ = _canonical_input(tg, vert_props,
+                                                        edge_props, weight)
+    colors = _exact_ranks(vert_raw)
+    lab, orbits = canonical_search(index.offsets, index.indices, labels, colors)
+    perm = np.empty(tg.vert_N, dtype=np.int64)
+    perm[lab] = np.arange(tg.vert_N)
+    return perm, orbits
+
+def get_canonical_hash(tg, vert_props=[], edge_props=[], weight=False):
+    """
+    Hash of the canonical form of a graph (see get_canonical_labeling). Two
+    graphs have the same hash exactly when they are isomorphic, up to hash
+    collisions of the 64-bit digest.
+
+    Inputs:
+        tg (TinyGraph): graph to hash.
+        vert_props, edge_props, weight: as in get_canonical_labeling.
+
+    Outputs:
+        hash (int): 64-bit canonical hash.
+    """
+    index, rows, cols, labels, vert_raw, arc_raw = \
+        _canonical_input(tg, vert_props, edge_props, weight)
+    colors = _exact_ranks(vert_raw)
+    lab, _ = canonical_search(index.offsets, index.indices, labels, colors)
+    perm = np.empty(tg.vert_N, dtype=np.int64)
+    perm[lab] = np.arange(tg.vert_N)
+
+    new_rows = perm[rows]
+    new_cols = perm[cols]
+    order = np.lexsort((new_cols, new_rows))
+
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(np.array([tg.vert_N, len(rows), vert_raw.shape[1], 
+                            arc_raw.shape[1]], dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(vert_raw[lab]).tobytes())
+    digest.update(new_rows[order].tobytes())
+    digest.update(new_cols[order].tobytes())
+    digest.update(np.ascontiguousarray(arc_raw[order]).tobytes())
+    return int.from_bytes(digest.digest(), 'little')
+
+
+### Subgraph matching ###
+
+def _match_labels(graphs, vert_props, edge_props, weight):
+    """
+    Vertex labels and dense edge label matrices (0 for no edge) for each 
+    graph, ranked jointly so that equal property values get equal labels in
+    every graph.
+    """
+    indexes = [get_neighbor_index(g) for g in graphs]
+    vert_raw = np.concatenate([_row_bytes([g.v[p] for p in vert_props], 
+                                          g.vert_N) for g in graphs])
+    arc_raw = []
+    arcs = []
+    for g, index in zip(graphs, indexes):
+        rows = np.repeat(np.arange(g.vert_N), index.degrees)
+        values = [g.e_p[p][rows, index.indices] for p in edge_props]
+        if weight:
+            values.insert(0, index.weights)
+        arc_raw.append(_row_bytes(values, len(rows)))
+        arcs.append((rows, index.indices))
+    vert_labels = _exact_ranks(vert_raw)
+    arc_labels = _exact_ranks(np.concatenate(arc_raw)) + 1
+
+    out = []
+    v_start = 0
+    a_start = 0
+    for g, (rows, cols) in zip(graphs, arcs):
+        edges = np.zeros((g.vert_N, g.vert_N), dtype=np.int32)
+        edges[rows, cols] = arc_labels[a_start:a_start + len(rows)]
+        out.append((vert_labels[v_start:v_start + g.vert_N], edges))
+        v_start += g.vert_N
+        a_start += len(rows)
+    return indexes, out
+
+def _match_order(index):
+    """
+    Order the pattern vertices for matching: start from the highest degree
+    vertex, then repeatedly take the vertex with the most already ordered 
+    neighbors (ties to higher degree). Returns the order and, for each 
+    position, the position of an earlier neighbor (-1 if there is none).
+    """
+    n = index.vert_N
+    degrees = index.degrees
+    connections = np.zeros(n, dtype=np.int64)
+    placed = np.zeros(n, dtype=bool)
+    position = np.full(n, -1, dtype=np.int32)
+    order = np.zeros(n, dtype=np.int64)
+    parent = np.full(n, -1, dtype=np.int32)
+    for i in range(n):
+        key = np.where(placed, -1, connections * (n + 1) + degrees)
+        v = int(np.argmax(key))
+        order[i] = v
+        placed[v] = True
+        position[v] = i
+        nbrs = index.indices[index.offsets[v]:index.offsets[v+1]]
+        if connections[v] > 0:
+            parent[i] = np.min(position[nbrs][placed[nbrs]])
+        connections[nbrs] += 1
+    return order, parent
+
+def _match_prepared(p_index, p_labels, p_edges, order, parent, t_index, 
+                    t_labels, t_edges, induced, mode):
+    n = p_index.vert_N
+    if n == 0:
+        return 1, np.zeros((1, 0), dtype=np.int64)
+    if t_index.vert_N < n or len(t_index.indices) < len(p_index.indices):
+        return 0, np.zeros((0, n), dtype=np.int64)
+    count, found = subgraph_match(
+        np.ascontiguousarray(p_labels[order]), 
+        np.ascontiguousarray(p_index.degrees[order]).astype(np.int32), 
+        parent, np.ascontiguousarray(p_edges[np.ix_(order, order)]),
+        t_labels, t_index.offsets, t_index.indices, t_edges, induced, mode)
+    # back from match order to pattern vertex order
+    matches = np.empty_like(found)
+    matches[:, order] = found
+    return count, matches
+
+def _match_result(count, matches, mode):
+    if mode == 'first':
+        return matches[0] if count > 0 else None
+    elif mode == 'count':
+        return count
+    return matches
+
+def find_subgraph_matches(pattern, target, mode='first', vert_props=[],
+                          edge_props=[], weight=False, induced=False):
+    """
+    Find where pattern occurs as a subgraph of target: injective maps of the
+    pattern vertices to target vertices that carry every pattern edge to a
+    target edge (and, if induced, every non-edge to a non-edge). Vertices and
+    edges must agree on the chosen properties. Symmetric patterns match the
+    same target vertices once per pattern automorphism.
+
+    Inputs:
+        pattern (TinyGraph): graph to look for.
+        target (TinyGraph): graph to look in.
+        mode (str): 'first' to stop at the first match, 'count' to only count
+            the matches, 'all' to enumerate them.
+        vert_props ([str]): vertex properties that must be equal.
+        edge_props ([str]): edge properties that must be equal.
+        weight (bool): whether edge weights must be equal.
+        induced (bool): whether to look for induced subgraphs only.
+
+    Outputs:
+        Depending on mode: 'first' gives an array m with m[pattern_vertex] =
+        target_vertex, or None if there is no match; 'count' gives the number
+        of matches; 'all' gives a (num_matches x pattern.vert_N) array of 
+        such maps.
+    """
+    if mode not in ('first', 'count', 'all'):
+        raise ValueError(f"unknown match mode {mode}")
+    indexes, labels = _match_labels([pattern, target], vert_props, 
+                                    edge_props, weight)
+    (p_labels, p_edges), (t_labels, t_edges) = labels
+    order, parent = _match_order(indexes[0])
+    count, matches = _match_prepared(indexes[0], p_labels, p_edges, order,
+                                     parent, indexes[1], t_labels, t_edges,
+                                     induced, mode)
+    return _match_result(count, matches, mode)
+
+def find_subgraph_matches_batch(pattern, targets, mode='first', vert_props=[],
+                                edge_props=[], weight=False, induced=False):
+    """
+    find_subgraph_matches of one pattern against many targets. Labels and 
+    the match order are computed once, and targets that are too small or 
+    lack some vertex label of the pattern are rejected without searching.
+
+    Inputs:
+        pattern (TinyGraph): graph to look for.
+        targets ([TinyGraph]): graphs to look in.
+        mode, vert_props, edge_props, weight, induced: as in 
+            find_subgraph_matches.
+
+    Outputs:
+        Depending on mode: 'first' gives a bool array of which targets 
+        contain the pattern; 'count' an int64 array of match counts; 'all' a
+        list with the array of matches of every target.
+    """
+    if mode not in ('first', 'count', 'all'):
+        raise ValueError(f"unknown match mode {mode}")
+    targets = list(targets)
+    indexes, labels = _match_labels([pattern] + targets, vert_props, 
+                                    edge_props, weight)
+    p_index = indexes[0]
+    p_labels, p_edges = labels[0]
+    order, parent = _match_order(p_index)
+    n_labels = max([len(l) and l.max() + 1 for l, _ in labels] + [1])
+    p_counts = np.bincount(p_labels, minlength=n_labels)
+
+    counts = np.zeros(len(targets), dtype=np.int64)
+    all_matches = []
+    for b, (t_index, (t_labels, t_edges)) in enumerate(zip(indexes[1:], 
+                                                           labels[1:])):
+        if np.any(np.bincount(t_labels, minlength=n_labels) < p_counts):
+            count = 0
+            matches = np.zeros((0, pattern.vert_N), dtype=np.int64)
+        else:
+            count, matches = _match_prepared(p_index, p_labels, p_edges, 
+                                             order, parent, t_index, t_labels,
+                                             t_edges, induced, 
+                                             mode)
+        counts[b] = count
+        all_matches.append(matches)
+
+    if mode == 'first':
+        return counts > 0
+    elif mode == 'count':
+        return counts
+    return all_matches
+
+
+### Centrality ###
+
+def _centralities(index, sizes, weighted, normalized):
+    """
+    Run Brandes' algorithm over index, where vertex v belongs to a graph with
+    sizes[v] vertices, and scale the results like networkx does. Returns the
+    vertex betweenness, arc betweenness, closeness and harmonic centrality.
+    """
+    betweenness, arcs, dist_sum, reached, harmonic = brandes(index, weighted)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if normalized:
+            betweenness *= np.where(sizes > 2, 
+                                    1 / ((sizes - 1.0) * (sizes - 2.0)), 1)
+            arc_sizes = np.repeat(sizes, index.degrees)
+            arcs /= arc_sizes * (arc_sizes - 1.0)
+        else:
+            betweenness *= 0.5
+            arcs *= 0.5
+        # Wasserman-Faust scaling for graphs that are not connected
+        closeness = np.where(dist_sum > 0, (reached - 1.0)**2 / dist_sum 
+                             / (sizes - 1.0), 0.0)
+    return betweenness, arcs, closeness, harmonic
+
+def _edge_matrix(index, arcs, start, stop):
+    """
+    Symmetric matrix of per-edge values from the values of the arcs of 
+    vertices start to stop of index, adding up both arcs of every edge.
+    """
+    N = stop - start
+    lo, hi = index.offsets[start], index.offsets[stop]
+    rows = np.repeat(np.arange(N), index.degrees[start:stop])
+    out = np.zeros((N, N), dtype=np.float64)
+    out[rows, index.indices[lo:hi] - start] = arcs[lo:hi]
+    return out + out.T
+
+def get_betweenness_centrality(tg, weighted=False, normalized=True):
+    """
+    Betweenness centrality of every vertex: the sum over pairs of other 
+    vertices of the fraction of shortest paths between them that pass through
+    it. Computed natively with Brandes' algorithm, using a BFS or (if 
+    weighted) Dijkstra from every vertex. Matches networkx's 
+    betweenness_centrality.
+
+    Inputs:
+        tg (TinyGraph): graph to find the centralities of.
+        weighted (bool): Whether path lengths are the sums of the (non-negative)
+            edge weights or the number of edges.
+        normalized (bool): Whether to divide by the number of pairs of other
+            vertices, (N-1)(N-2)/2.
+
+    Outputs:
+        betweenness (np array): float64 array with the betweenness of every
+            vertex.
+    """
+    index = get_neighbor_index(tg)
+    sizes = np.full(tg.vert_N, tg.vert_N)
+    return _centralities(index, sizes, weighted, normalized)[0]
+
+def get_edge_betweenness_centrality(tg, weighted=False, normalized=True):
+    """
+    Betweenness centrality of every edge: the sum over pairs of vertices of
+    the fraction of shortest paths between them that use it. Matches 
+    networkx's edge_betweenness_centrality.
+
+    Inputs:
+        tg (TinyGraph): graph to find the centralities of.
+        weighted (bool): as in get_betweenness_centrality.
+        normalized (bool): Whether to divide by the number of pairs of 
+            vertices, N(N-1)/2.
+
+    Outputs:
+        betweenness (np array): symmetric float64 vert_N x vert_N matrix with
+            the betweenness of every edge, 0 where there is no edge.
+    """
+    index = get_neighbor_index(tg)
+    sizes = np.full(tg.vert_N, tg.vert_N)
+    arcs = _centralities(index, sizes, weighted, normalized)[1]
+    return _edge_matrix(index, arcs, 0, tg.vert_N)
+
+def get_closeness_centrality(tg, weighted=False):
+    """
+    Closeness centrality of every vertex: the number of other vertices it
+    reaches divided by the sum of the distances to them, scaled by the 
+    fraction of the other vertices it reaches (Wasserman and Faust), so that
+    it also makes sense for graphs that are not connected. Matches networkx's
+    closeness_centrality.
+
+    Inputs:
+        tg (TinyGraph): graph to find the centralities of.
+        weighted (bool): as in get_betweenness_centrality.
+
+    Outputs:
+        closeness (np array): float64 array with the closeness of every vertex.
+    """
+    index = get_neighbor_index(tg)
+    sizes = np.full(tg.vert_N, tg.vert_N)
+    return _centralities(index, sizes, weighted, True)[2]
+
+def get_harmonic_centrality(tg, weighted=False):
+    """
+    Harmonic centrality of every vertex: the sum of the reciprocal distances
+    to the other vertices (unreachable ones add 0). Matches networkx's
+    harmonic_centrality.
+
+    Inputs:
+        tg (TinyGraph): graph to find the centralities of.
+        weighted (bool): as in get_betweenness_centrality.
+
+    Outputs:
+        harmonic (np array): float64 array with the harmonic centrality of 
+            every vertex.
+    """
+    index = get_neighbor_index(tg)
+    sizes = np.full(tg.vert_N, tg.vert_N)
+    return _centralities(index, sizes, weighted, True)[3]
+
+def get_centrality_batch(graphs, weighted=False, normalized=True):
+    """
+    All the centralities of many graphs in one native Brandes pass over their
+    combined neighbor index.
+
+    Inputs:
+        graphs ([TinyGraph]): graphs to find the centralities of.
+        weighted (bool): as in get_betweenness_centrality.
+        normalized (bool): whether to normalize the vertex and edge 
+            betweenness, as in get_betweenness_centrality.
+
+    Outputs:
+        offsets (np array): int64 array of length len(graphs) + 1; the values 
+            of graph i are at offsets[i]:offsets[i+1] in the arrays below.
+        betweenness (np array): vertex betweenness of all graphs.
+        closeness (np array): closeness centrality of all graphs.
+        harmonic (np array): harmonic centrality of all graphs.
+        edge_betweenness ([np array]): edge betweenness matrix of every graph.
+    """
+    index = get_neighbor_index_batch(graphs)
+    offsets = index.graph_offsets
+    sizes = np.repeat(np.diff(offsets), np.diff(offsets))
+    betweenness, arcs, closeness, harmonic = _centralities(
+        index, sizes, weighted, normalized)
+    edge_betweenness = [_edge_matrix(index, arcs, offsets[b], offsets[b+1])
+                        for b in range(len(offsets) - 1)]
+    return offsets, betweenness, closeness, harmonic, edge_betweenness
+
+
+### Biconnected components ###
+
+def get_biconnected_components(tg):
+    """
+    Decompose a graph into its biconnected components with a single compiled
+    (iterative) Tarjan depth-first search, in O(N + E) time after building
+    the neighbor index.
+
+    Inputs:
+        tg (TinyGraph): graph to decompose.
+
+    Outputs:
+        articulation_points (np array): bool array of length vert_N, true for
+            the vertices whose removal disconnects their component.
+        bridges (np array): int64 array of shape (B, 2) with the edges 
+            (i, j), i < j, whose removal disconnects their component, sorted.
+        components (np array): symmetric int32 vert_N x vert_N matrix with 
+            the biconnected component of every edge (numbered from 0, in no
+            particular order), and -1 where there is no edge.
+    """
+    index = get_neighbor_index(tg)
+    articulation, bridge_arcs, arc_components = tarjan_biconnected(index)
+    rows = np.repeat(np.arange(tg.vert_N), index.degrees)
+    cols = index.indices
+
+    bridges = np.sort(np.stack([rows[bridge_arcs], cols[bridge_arcs]], 
+                               axis=1), axis=1)
+    bridges = bridges[np.lexsort((bridges[:, 1], bridges[:, 0]))]
+
+    components = np.full((tg.vert_N, tg.vert_N), -1, dtype=np.int32)
+    components[rows, cols] = arc_components
+    components = np.maximum(components, components.T)
+    return articulation, bridges.astype(np.int64), components
+
+
+### Spanning forests ###
+
+def _min_spanning_forest(index, weighted):
+    """
+    Kruskal over the edges of index. Returns the endpoints (i < j) and 
+    weights of the forest edges, sorted by endpoints.
+    """
+    rows = np.repeat(np.arange(index.vert_N, dtype=np.int32), index.degrees)
+    upper = index.indices > rows
+    rows = rows[upper]
+    cols = index.indices[upper]
+    weights = index.weights[upper]
+    if weighted:
+        order = np.argsort(weights, kind='stable')
+    else:
+        order = np.arange(len(rows), dtype=np.int64)
+    chosen = kruskal(index.vert_N, rows, cols, order)
+    return rows[chosen], cols[chosen], weights[chosen]
+
+def get_min_spanning_forest(tg, weighted=True, as_graph=False):
+    """
+    Minimum spanning forest of a graph (a minimum spanning tree of every 
+    connected component), with Kruskal's algorithm in compiled code. Ties 
+    between equal weights go to the edge (i, j) that comes first in 
+    row-major order.
+
+    Inputs:
+        tg (TinyGraph): graph to span.
+        weighted (bool): Whether to minimize the sum of the edge weights, or
+            to take any spanning forest.
+        as_graph (bool): Whether to return the forest as a TinyGraph instead 
+            of edge arrays.
+
+    Outputs:
+        edges (np array): int64 array of shape (vert_N - components, 2) with 
+            the forest edges (i, j), i < j, sorted.
+        weights (np array): float64 array with the weight of every edge.
+        Or, if as_graph, forest (TinyGraph): graph with the vertices of tg, 
+            with their properties, and only the forest edges, with their 
+            weights and properties.
+    """
+    if weighted and not np.issubdtype(tg.adjacency.dtype, np.number):
+        raise TypeError("Graph weights are not numbers.")
+    rows, cols, weights = _min_spanning_forest(get_neighbor_index(tg), 
+                                               weighted)
+    if not as_graph:
+        return np.stack([rows, cols], axis=1).astype(np.int64), weights
+
+    forest = tinygraph.empty_like(tg)
+    for k, v in tg.v.items():
+        forest.v[k][:] = v
+    for adj_out, adj in [(forest.adjacency, tg.adjacency)] + \
+            [(forest.e_p[k], e) for k, e in tg.e_p.items()]:
+        adj_out[rows, cols] = adj[rows, cols]
+        adj_out[cols, rows] = adj[cols, rows]
+    forest.props = deepcopy(tg.props)
+    return forest
+
+def get_min_spanning_forest_batch(graphs, weighted=True):
+    """
+    get_min_spanning_forest of many graphs in one Kruskal pass over their 
+    combined neighbor index.
+
+    Inputs:
+        graphs ([TinyGraph]): graphs to span.
+        weighted (bool): as in get_min_spanning_forest.
+
+    Outputs:
+        offsets (np array): int64 array of length len(graphs) + 1; the edges
+            of graph i are at offsets[i]:offsets[i+1] in the arrays below.
+        edges (np array): int64 array of shape (num_edges, 2) with the 
+            forest edges of every graph, numbered within their graph.
+        weights (np array): float64 array with the weight of every edge.
+    """
+    index = get_neighbor_index_batch(graphs)
+    rows, cols, weights = _min_spanning_forest(index, weighted)
+    graph = np.searchsorted(index.graph_offsets, rows, side='right') - 1
+    offsets = np.searchsorted(graph, np.arange(len(index.graph_offsets)))
+    start = index.graph_offsets[graph]
+    edges = np.stack([rows - start, cols - start], axis=1).astype(np.int64)
+    return offsets.astype(np.int64), edges, weights
+
+
+### Neighborhoods ###
+
+def get_k_hop_neighborhoods(tg, k, bitset=False):
+    """
+    The vertices within k hops of every vertex (itself included), from one
+    compiled bounded BFS per vertex.
+
+    Inputs:
+        tg (TinyGraph): graph to find the neighborhoods in.
+        k (int): number of hops.
+        bitset (bool): Whether to return the neighborhoods as a packed bitset 
+            instead of a ragged array.
+
+    Outputs:
+        indptr (np array): int64 array of length vert_N + 1.
+        members (np array): int32 array, where the neighborhood of vertex v is
+            members[indptr[v]:indptr[v+1]], sorted.
+        Or, if bitset, neighborhoods (np array): uint8 array of shape 
+            (vert_N, ceil(vert_N / 8)) where row v is the np.packbits of the
+            membership of every vertex in the neighborhood of v.
+    """
+    if k < 0:
+        raise ValueError("Number of hops must be non-negative.")
+    indptr, members = k_hop(get_neighbor_index(tg), k)
+    if not bitset:
+        return indptr, members
+    dense = np.zeros((tg.vert_N, tg.vert_N), dtype=bool)
+    dense[np.repeat(np.arange(tg.vert_N), np.diff(indptr)), members] = True
+    return np.packbits(dense, axis=1)
+
+def get_ego_subgraphs_batch(tg, k):
+    """
+    The subgraphs induced by the k-hop neighborhood of every vertex, packed 
+    into one buffer in the layout get_shortest_paths_batch accepts. The 
+    blocks are gathered with a single fancy-indexing pass. Vertex properties
+    of the subgraphs can be gathered the same way, as g.v[prop][members].
+
+    Inputs:
+        tg (TinyGraph): graph to take the subgraphs of.
+        k (int): number of hops.
+
+    Outputs:
+        adjacency (np array): flat array of the adjacency dtype, where the 
+            subgraph around vertex v is 
+            adjacency[offsets[v]:offsets[v+1]].reshape(sizes[v], sizes[v]).
+        sizes (np array): int32 array with the number of vertices of every 
+            subgraph.
+        offsets (np array): int64 array of length vert_N + 1 with the start
+            of every subgraph in adjacency.
+        indptr, members (np array): the neighborhoods as returned by 
+            get_k_hop_neighborhoods; vertex i of the subgraph around v is 
+            vertex members[indptr[v] + i] of tg.
+        centers (np array): int64 array with the position of every vertex in
+            its own subgraph.
+    """
+    indptr, members = get_k_hop_neighborhoods(tg, k)
+    sizes = np.diff(indptr)
+    offsets = np.zeros(tg.vert_N + 1, dtype=np.int64)
+    np.cumsum(sizes**2, out=offsets[1:])
+
+    # for every entry of the packed buffer, its subgraph and row and column
+    block = np.repeat(np.arange(tg.vert_N), sizes**2)
+    local = np.arange(offsets[-1]) - offsets[block]
+    n = sizes[block]
+    rows = members[indptr[block] + local // n]
+    cols = members[indptr[block] + local % n]
+    adjacency = tg.adjacency[rows, cols]
+
+    centers = np.zeros(tg.vert_N, dtype=np.int64)
+    vertex = np.repeat(np.arange(tg.vert_N), sizes)
+    is_center = members == vertex
+    centers[vertex[is_center]] = np.flatnonzero(is_center) - \
+        indptr[vertex[is_center]]
+    return adjacency, sizes.astype(np.int32), offsets, indptr, members, \
+        centers
+
+
+### Random walks ###
+
+def get_random_walks(tg, walk_length, starts=None, n_walks=1, weighted=False,
+                     p=1, q=1, rng=None, out=None):
+    """
+    Random walks generated natively, without the GIL, so several threads can
+    fill parts of a large walk array at once. Every step goes to a neighbor 
+    of the current vertex chosen uniformly, proportionally to the edge 
+    weight if weighted, and with the node2vec return parameter p and in-out
+    parameter q: the weight of going back to the previous vertex is divided
+    by p, and that of moving to a vertex not adjacent to the previous one by
+    q.
+
+    Inputs:
+        tg (TinyGraph): graph to walk on.
+        walk_length (int): number of vertices in each walk, the start 
+            included.
+        starts ([int]): vertices to start walks from, all vertices by default.
+        n_walks (int): number of walks from every start; the walks are in 
+            n_walks rounds over the starts.
+        weighted (bool): whether to bias the steps by the (positive) weights.
+        p, q (float): node2vec parameters, p = q = 1 for a first-order walk.
+        rng (np.random.Generator, int or None): source of the seed of the 
+            walks, anything np.random.default_rng accepts.
+        out (np array): optional preallocated int32 array of shape 
+            (n_walks * len(starts), walk_length) to write the walks into.
+
+    Outputs:
+        walks (np array): int32 array of shape 
+            (n_walks * len(starts), walk_length) with one walk per row, padded
+            with -1 after reaching a vertex without neighbors.
+    """
+    if weighted and not np.issubdtype(tg.adjacency.dtype, np.number):
+        raise TypeError("Graph weights are not numbers.")
+    if p <= 0 or q <= 0:
+        raise ValueError("node2vec parameters p and q must be positive.")
+    index = get_neighbor_index(tg)
+    if weighted and np.any(index.weights <= 0):
+        raise ValueError("Weighted walks need positive edge weights.")
+
+    if starts is None:
+        starts = np.arange(tg.vert_N)
+    starts = np.tile(np.asarray(starts, dtype=np.int32), n_walks)
+    if np.any(starts < 0) or np.any(starts >= tg.vert_N):
+        raise IndexError("Start vertex out of range.")
+    shape = (len(starts), walk_length)
+    if out is None:
+        out = np.empty(shape, dtype=np.int32)
+    elif out.shape != shape or out.dtype != np.int32:
+        raise ValueError(f"out must be an int32 array of shape {shape}.")
+
+    seed = np.random.default_rng(rng).integers(2**64, dtype=np.uint64)
+    if walk_length > 0:
+        random_walks(index, starts, weighted, p, q, seed, out)
+    return out
+
+
+### Triangles and clustering ###
+
+# Triangles are counted with the sparse neighbor intersection kernel on 
+# graphs that are both large enough and sparse enough, and with a BLAS
+# matrix product otherwise.
+TRIANGLES_SPARSE_MIN_VERT_N = 64
+TRIANGLES_SPARSE_MAX_DENSITY = 0.1
+
+def _choose_triangles_method(tg, method):
+    if method == 'auto':
+        N = tg.vert_N
+        if N >= TRIANGLES_SPARSE_MIN_VERT_N and \
+                tg.edge_N / (N * (N - 1) / 2) <= TRIANGLES_SPARSE_MAX_DENSITY:
+            return 'sparse'
+        return 'dense'
+    if method not in ('dense', 'sparse'):
+        raise ValueError(f"unknown triangle counting method {method}")
+    return method
+
+def _triangles_dense(adjacency):
+    """
+    Triangles at every vertex of one (N x N) or a stack of (B x N x N) 
+    adjacency matrices, as the diagonal of A^3 over 2.
+    """
+    a = (adjacency != 0).astype(np.float64)
+    paths = np.matmul(a, a)
+    return np.rint((paths * a).sum(axis=-1) / 2).astype(np.int64)
+
+def get_triangles(tg, method='auto'):
+    """
+    Number of triangles every vertex is part of.
+
+    Inputs:
+        tg (TinyGraph): graph to count the triangles of.
+        method (str): 'dense' for the matrix product (A @ A) * A, 'sparse' for
+            the compiled intersection of sorted neighbor lists, or 'auto' to 
+            use the sparse kernel on graphs with at least 
+            TRIANGLES_SPARSE_MIN_VERT_N vertices and an edge density of at 
+            most TRIANGLES_SPARSE_MAX_DENSITY.
+
+    Outputs:
+        triangles (np array): int64 array with the triangles at every vertex.
+    """
+    if _choose_triangles_method(tg, method) == 'sparse':
+        return triangles_sparse(get_neighbor_index(tg))
+    return _triangles_dense(tg.adjacency)
+
+def _clustering(triangles, degrees):
+    pairs = degrees * (degrees - 1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(pairs > 0, triangles / pairs, 0.0)
+
+def get_clustering(tg, method='auto'):
+    """
+    Local clustering coefficient of every vertex: the fraction of pairs of
+    its neighbors that are adjacent (0 for vertices with fewer than two
+    neighbors). Matches networkx's clustering for unweighted graphs.
+
+    Inputs:
+        tg (TinyGraph): graph to find the clustering of.
+        method (str): as in get_triangles.
+
+    Outputs:
+        clustering (np array): float64 array with the coefficient of every 
+            vertex.
+    """
+    degrees = np.count_nonzero(tg.adjacency, axis=1)
+    return _clustering(get_triangles(tg, method), degrees)
+
+def get_average_clustering(tg, method='auto'):
+    """
+    The mean of the local clustering coefficients (0 for the empty graph).
+
+    Inputs:
+        tg (TinyGraph): graph to find the clustering of.
+        method (str): as in get_triangles.
+
+    Outputs:
+        clustering (float): average clustering coefficient.
+    """
+    if tg.vert_N == 0:
+        return 0.0
+    return float(np.mean(get_clustering(tg, method)))
+
+def get_transitivity(tg, method='auto'):
+    """
+    Transitivity (global clustering coefficient) of a graph: three times the
+    number of triangles over the number of paths of length two, or 0 if 
+    there are none.
+
+    Inputs:
+        tg (TinyGraph): graph to find the transitivity of.
+        method (str): as in get_triangles.
+
+    Outputs:
+        transitivity (float): transitivity of tg.
+    """
+    degrees = np.count_nonzero(tg.adjacency, axis=1)
+    pairs = np.sum(degrees * (degrees - 1) / 2)
+    if pairs == 0:
+        return 0.0
+    return float(np.sum(get_triangles(tg, method)) / pairs)
+
+def get_clustering_batch(graphs, method='auto'):
+    """
+    Triangles and clustering of many graphs. Graphs counted with the sparse 
+    kernel (chosen per graph as in get_triangles) go through it in one pass 
+    over their combined neighbor index, and the others through one stacked
+    matrix product per distinct size.
+
+    Inputs:
+        graphs ([TinyGraph]): graphs to find the clustering of.
+        method (str): as in get_triangles.
+
+    Outputs:
+        offsets (np array): int64 array of length len(graphs) + 1; the values
+            of graph i are at offsets[i]:offsets[i+1] in the per-vertex 
+            arrays below.
+        triangles (np array): int64 triangles at every vertex.
+        clustering (np array): float64 local clustering of every vertex.
+        average_clustering (np array): float64 average clustering of every 
+            graph.
+        transitivity (np array): float64 transitivity of every graph.
+    """
+    graphs = list(graphs)
+    sizes = np.array([g.vert_N for g in graphs], dtype=np.int64)
+    offsets = np.zeros(len(graphs) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    triangles = np.zeros(offsets[-1], dtype=np.int64)
+    degrees = np.zeros(offsets[-1], dtype=np.int64)
+
+    methods = [_choose_triangles_method(g, method) for g in graphs]
+    sparse = [b for b, m in enumerate(methods) if m == 'sparse']
+    if sparse:
+        index = get_neighbor_index_batch([graphs[b] for b in sparse])
+        counts = triangles_sparse(index)
+        for i, b in enumerate(sparse):
+            lo, hi = index.graph_offsets[i], index.graph_offsets[i+1]
+            triangles[offsets[b]:offsets[b+1]] = counts[lo:hi]
+    dense = [b for b, m in enumerate(methods) if m == 'dense']
+    for N in np.unique(sizes[dense]):
+        same = [b for b in dense if sizes[b] == N]
+        counts = _triangles_dense(np.stack([graphs[b].adjacency 
+                                            for b in same]))
+        for i, b in enumerate(same):
+            triangles[offsets[b]:offsets[b+1]] = counts[i]
+    for b, g in enumerate(graphs):
+        degrees[offsets[b]:offsets[b+1]] = np.count_nonzero(g.adjacency, 
+                                                            axis=1)
+
+    clustering = _clustering(triangles, degrees)
+    graph = np.repeat(np.arange(len(graphs)), sizes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        average = np.bincount(graph, clustering, len(graphs)) / sizes
+        pairs = np.bincount(graph, degrees * (degrees - 1) / 2, len(graphs))
+        transitivity = np.bincount(graph, triangles, len(graphs)) / pairs
+    average[sizes == 0] = 0
+    transitivity[pairs == 0] = 0
+    return offsets, triangles, clustering, average, transitivity
+
+
+### Graphlets ###
+
+# For every graphlet G0 to G8, the orbit whose count sums to a multiple of 
+# the number of graphlets, and that multiple.
+_GRAPHLET_ORBITS = np.array([0, 2, 3, 5, 7, 8, 11, 13, 14])
+_GRAPHLET_ORBIT_SIZES = np.array([2, 1, 3, 2, 1, 4, 1, 2, 4])
+
+def _graphlet_orbits(index):
+    """
+    Orbit counts of every vertex of index. The orbits of the graphlets on 
+    two and three vertices follow from the degrees and triangles, those on
+    four vertices are counted by the compiled enumeration.
+    """
+    orbits = np.zeros((index.vert_N, 15), dtype=np.int64)
+    degrees = index.degrees.astype(np.int64)
+    triangles = triangles_sparse(index)
+    rows = np.repeat(np.arange(index.vert_N), index.degrees)
+    neighbor_degrees = np.bincount(rows, degrees[index.indices], 
+                                   index.vert_N).astype(np.int64)
+    orbits[:, 0] = degrees
+    orbits[:, 1] = neighbor_degrees - degrees - 2 * triangles
+    orbits[:, 2] = degrees * (degrees - 1) // 2 - triangles
+    orbits[:, 3] = triangles
+    return graphlet4_orbits(index, orbits)
+
+def _graphlet_counts(orbits):
+    return orbits[..., _GRAPHLET_ORBITS].sum(axis=-2) // _GRAPHLET_ORBIT_SIZES
+
+def get_graphlet_orbits(tg):
+    """
+    Graphlet orbit counts of every vertex, for the connected graphlets on two
+    to four vertices: for every orbit, the number of induced subgraphs 
+    isomorphic to its graphlet in which the vertex sits at that orbit. Orbits
+    are numbered as by Przulj (2007): 0 edge; 1 end and 2 middle of a path of
+    three; 3 triangle; 4 end and 5 middle of a path of four; 6 leaf and 7 
+    center of a star; 8 four-cycle; 9 tail, 10 triangle vertex of degree two
+    and 11 of degree three of a triangle with a tail; 12 degree two and 13
+    degree three vertex of a diamond; 14 four-clique. Graphlets on five 
+    vertices are not counted.
+
+    Inputs:
+        tg (TinyGraph): graph to count the graphlets of.
+
+    Outputs:
+        orbits (np array): int64 array of shape (vert_N, 15).
+    """
+    return _graphlet_orbits(get_neighbor_index(tg))
+
+def get_graphlet_counts(tg):
+    """
+    Number of induced copies of each connected graphlet on two to four 
+    vertices, derived from the orbit counts: G0 edge, G1 path of three, G2 
+    triangle, G3 path of four, G4 star, G5 four-cycle, G6 triangle with a
+    tail, G7 diamond, G8 four-clique.
+
+    Inputs:
+        tg (TinyGraph): graph to count the graphlets of.
+
+    Outputs:
+        counts (np array): int64 array of length 9.
+    """
+    return _graphlet_counts(get_graphlet_orbits(tg))
+
+def get_graphlet_orbits_batch(graphs):
+    """
+    Graphlet orbits and counts of many graphs in one pass over their combined
+    neighbor index.
+
+    Inputs:
+        graphs ([TinyGraph]): graphs to count the graphlets of.
+
+    Outputs:
+        offsets (np array): int64 array of length len(graphs) + 1; the orbits
+            of graph i are at offsets[i]:offsets[i+1].
+        orbits (np array): int64 array of shape (total vertices, 15), as in 
+            get_graphlet_orbits.
+        counts (np array): int64 array of shape (len(graphs), 9), as in 
+            get_graphlet_counts.
+    """
+    index = get_neighbor_index_batch(graphs)
+    offsets = index.graph_offsets
+    orbits = _graphlet_orbits(index)
+    graph = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    sums = np.zeros((len(offsets) - 1, len(_GRAPHLET_ORBITS)), dtype=np.int64)
+    np.add.at(sums, graph, orbits[:, _GRAPHLET_ORBITS])
+    return offsets, orbits, sums // _GRAPHLET_ORBIT_SIZES
+
+
+### Distance descriptors ###
+
+DISTANCE_DESCRIPTORS = ('wiener', 'balaban_j', 'eccentricity', 'diameter', 
+                        'radius', 'distance_histogram')
+
+def _distance_descriptors(distances, offsets, sizes, index, descriptors, 
+                          n_bins):
+    """
+    The requested distance descriptors from packed distance matrices (graph 
+    b at offsets[b], with sizes[b] vertices) and the neighbor index of the
+    graphs (for the edges).
+    """
+    unknown = set(descriptors) - set(DISTANCE_DESCRIPTORS)
+    if unknown:
+        raise ValueError(f"unknown distance descriptors {sorted(unknown)}")
+    vert_offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=vert_offsets[1:])
+    if 'distance_histogram' not in descriptors:
+        n_bins = 0
+    wiener, diameter, radius, components, histogram, row_sums, eccentricity \
+        = distance_descriptors(distances, offsets, vert_offsets, n_bins)
+
+    out = {'offsets' : vert_offsets}
+    for name, value in [('wiener', wiener), ('eccentricity', eccentricity),
+                        ('diameter', diameter), ('radius', radius), 
+                        ('distance_histogram', histogram)]:
+        if name in descriptors:
+            out[name] = value
+    if 'balaban_j' in descriptors:
+        # J = m / (mu + 1) * sum over edges of (s_i s_j)^(-1/2), with s the
+        # distance sums and mu = m - n + c the cyclomatic number
+        graph = np.repeat(np.arange(len(sizes)), sizes)
+        rows = np.repeat(np.arange(index.vert_N), index.degrees)
+        upper = index.indices > rows
+        rows, cols = rows[upper], index.indices[upper]
+        terms = 1 / np.sqrt(row_sums[rows] * row_sums[cols])
+        edge_sums = np.bincount(graph[rows], terms, len(sizes))
+        m = np.bincount(graph[rows], minlength=len(sizes))
+        mu = m - sizes + components
+        out['balaban_j'] = np.where(m > 0, m / (mu + 1.0) * edge_sums, 0.0)
+    return out
+
+def get_distance_descriptors(tg, descriptors=DISTANCE_DESCRIPTORS, 
+                             weighted=False, n_bins=10, distances=None):
+    """
+    Distance based topological descriptors, computed together in one fused
+    native pass over the shortest path distance matrix. Graphs that are not
+    connected have infinite Wiener index, eccentricities and diameter.
+
+    Inputs:
+        tg (TinyGraph): graph to describe.
+        descriptors ([str]): which of DISTANCE_DESCRIPTORS to compute:
+            'wiener': sum of the distances over all pairs of vertices.
+            'balaban_j': Balaban's J index.
+            'eccentricity': distance from every vertex to the farthest one.
+            'diameter', 'radius': largest and smallest eccentricity.
+            'distance_histogram': number of pairs of vertices at distance 
+                1, 2, ..., n_bins, the last bin also counting all pairs 
+                farther apart (distances are rounded to whole numbers).
+        weighted (bool): whether to use weighted distances, as in 
+            get_shortest_paths.
+        n_bins (int): number of bins of the distance histogram.
+        distances (np array): the distance matrix of tg, if it has already 
+            been computed with get_shortest_paths.
+
+    Outputs:
+        descriptors (dict): the requested descriptors by name; eccentricity
+            and distance_histogram are arrays, the others floats.
+    """
+    if distances is None:
+        distances = get_shortest_paths(tg, weighted)
+    distances = np.ascontiguousarray(distances, dtype=np.float64).ravel()
+    offsets = np.array([0, len(distances)], dtype=np.int64)
+    out = _distance_descriptors(distances, offsets, np.array([tg.vert_N]), 
+                                get_neighbor_index(tg), descriptors, n_bins)
+    del out['offsets']
+    for name in out:
+        if name not in ('eccentricity', 'distance_histogram'):
+            out[name] = float(out[name][0])
+    if 'distance_histogram' in out:
+        out['distance_histogram'] = out['distance_histogram'][0]
+    return out
+
+def get_distance_descriptors_batch(graphs, descriptors=DISTANCE_DESCRIPTORS,
+                                   weighted=False, n_bins=10):
+    """
+    get_distance_descriptors of many graphs: the distance matrices come from
+    get_shortest_paths_batch in one packed buffer, and a single native pass
+    over it fills one preallocated table of descriptors.
+
+    Inputs:
+        graphs ([TinyGraph]): graphs to describe.
+        descriptors, weighted, n_bins: as in get_distance_descriptors.
+
+    Outputs:
+        descriptors (dict): 'offsets', an int64 array of length 
+            len(graphs) + 1, and the requested descriptors by name: arrays 
+            with one value per graph (distance_histogram with one row per 
+            graph), except eccentricity, whose values for graph i are at 
+            offsets[i]:offsets[i+1].
+    """
+    graphs = list(graphs)
+    sizes = np.array([g.vert_N for g in graphs], dtype=np.int64)
+    distances, offsets = get_shortest_paths_batch(graphs, weighted, 
+                                                  ragged=True)
+    return _distance_descriptors(distances, offsets, sizes, 
+                                 get_neighbor_index_batch(graphs), 
+                                 descriptors, n_bins)
+
+
+### Eccentricity bounds ###
+
+def get_extrema(tg, weighted=False):
+    """
+    Diameter, radius, center and periphery of a graph with the bounding 
+    eccentricities algorithm of Takes and Kosters, without all-pairs 
+    shortest paths. Every BFS (or Dijkstra) from a vertex v gives its 
+    eccentricity e(v), and bounds max(d(v, w), e(v) - d(v, w)) <= e(w) <= 
+    e(v) + d(v, w) for every other vertex w. Vertices drop out once their 
+    eccentricity is known or the bounds show they are neither in the center
+    nor in the periphery, and the next source alternates between the 
+    candidate with the largest upper and the smallest lower bound. On large
+    sparse graphs this usually takes a handful of sweeps. Graphs that are 
+    not connected have infinite eccentricities everywhere.
+
+    Inputs:
+        tg (TinyGraph): graph to find the extrema of.
+        weighted (bool): whether to use the (non-negative) edge weights as 
+            lengths, as in get_shortest_paths.
+
+    Outputs:
+        diameter (float): largest eccentricity.
+        radius (float): smallest eccentricity.
+        center (np array): int64 array of the vertices of eccentricity radius.
+        periphery (np array): int64 array of the vertices of eccentricity
+            diameter.
+    """
+    N = tg.vert_N
+    if N == 0:
+        return 0.0, 0.0, np.zeros(0, dtype=np.int64), \
+            np.zeros(0, dtype=np.int64)
+    index = get_neighbor_index(tg)
+    if weighted and np.any(index.weights < 0):
+        raise ValueError("Eccentricity bounds need non-negative weights.")
+
+    lower = np.zeros(N)
+    upper = np.full(N, np.inf)
+    # exact eccentricities of the swept sources, nan for the others
+    exact = np.full(N, np.nan)
+    candidates = np.ones(N, dtype=bool)
+    degrees = index.degrees
+    # with real weights, e(v) - d(v, w) and e(v) + d(v, w) round, so bounds
+    # that should meet (or tie with the extrema) may differ in the last bits
+    tol = 0.0
+    high = True
+    while np.any(candidates):
+        # alternate between the candidate most likely in the periphery and
+        # the one most likely in the center, ties to higher degree
+        cand = np.flatnonzero(candidates)
+        if high:
+            key = np.lexsort((-degrees[cand], -upper[cand]))
+        else:
+            key = np.lexsort((-degrees[cand], lower[cand]))
+        v = cand[key[0]]
+        high = not high
+
+        dist = single_source_distances(index, v, weighted)
+        ecc = dist.max()
+        if ecc == np.inf:
+            everything = np.arange(N, dtype=np.int64)
+            return np.inf, np.inf, everything, everything.copy()
+        exact[v] = ecc
+        if weighted:
+            tol = max(tol, 1e-9 * ecc)
+        lower = np.maximum(lower, np.maximum(dist, ecc - dist))
+        upper = np.minimum(upper, ecc + dist)
+        lower[v] = upper[v] = ecc
+
+        known = ~np.isnan(exact) | (upper - lower <= tol)
+        max_lower = lower.max()
+        min_upper = upper.min()
+        candidates &= ~known & ((upper >= max_lower - tol) | 
+                                (lower <= min_upper + tol))
+
+    # eccentricities are exact for swept sources and pinned down by the 
+    # bounds for the rest
+    eccentricity = np.where(np.isnan(exact), lower, exact)
+    diameter = eccentricity.max()
+    radius = eccentricity.min()
+    center = np.flatnonzero(eccentricity <= radius + tol)
+    periphery = np.flatnonzero(eccentricity >= diameter - tol)
+    return float(diameter), float(radius), center, periphery
+
+
+### Spectral ###
+
+LAPLACIAN_KINDS = ('combinatorial', 'normalized', 'random_walk')
+
+def _spectral_adjacency(adjacencies, weighted, out):
+    """
+    Write the float64 weights (or 0/1 entries if not weighted) of one or a 
+    stack of adjacency matrices into out.
+    """
+    if weighted:
+        if not np.issubdtype(adjacencies[0].dtype, np.number):
+            raise TypeError("Graph weights are not numbers.")
+        for o, a in zip(out, adjacencies):
+            o[...] = a
+    else:
+        for o, a in zip(out, adjacencies):
+            np.not_equal(a, 0, out=o)
+    return out
+
+def _laplacian_in_place(a, kind):
+    """
+    Turn the (stack of) weight matrices a into Laplacians of the given kind,
+    without further copies. Vertices without edges get zero rows, as in 
+    networkx.
+    """
+    if kind not in LAPLACIAN_KINDS:
+        raise ValueError(f"unknown Laplacian kind {kind}")
+    degrees = a.sum(axis=-1)
+    np.negative(a, out=a)
+    diagonal = np.einsum('...ii->...i', a)
+    diagonal += degrees
+    with np.errstate(divide='ignore'):
+        if kind == 'normalized':
+            scale = np.where(degrees > 0, 1 / np.sqrt(degrees), 0)
+            a *= scale[..., :, None]
+            a *= scale[..., None, :]
+        elif kind == 'random_walk':
+            a *= np.where(degrees > 0, 1 / degrees, 0)[..., :, None]
+    return a
+
+def get_laplacian(tg, kind='combinatorial', weighted=True):
+    """
+    Laplacian matrix of a graph, built in a single float64 allocation.
+
+    Inputs:
+        tg (TinyGraph): graph to find the Laplacian of.
+        kind (str): one of LAPLACIAN_KINDS: 'combinatorial' for L = D - A, 
+            'normalized' for D^-1/2 L D^-1/2 and 'random_walk' for D^-1 L, 
+            where D is the diagonal matrix of the (weighted) degrees. Rows of
+            vertices without edges are zero.
+        weighted (bool): whether to use the edge weights, or 1 for every edge.
+
+    Outputs:
+        laplacian (np array): float64 vert_N x vert_N matrix.
+    """
+    out = np.empty((1, tg.vert_N, tg.vert_N), dtype=np.float64)
+    _spectral_adjacency([tg.adjacency], weighted, out)
+    return _laplacian_in_place(out[0], kind)
+
+def get_normalized_adjacency(tg, weighted=True, self_loops=False):
+    """
+    Symmetrically normalized adjacency matrix D^-1/2 A D^-1/2, as used by 
+    graph convolutions, built in a single float64 allocation.
+
+    Inputs:
+        tg (TinyGraph): graph to normalize the adjacency of.
+        weighted (bool): whether to use the edge weights, or 1 for every edge.
+        self_loops (bool): whether to add the identity to A (and so one to 
+            every degree) before normalizing.
+
+    Outputs:
+        adjacency (np array): float64 vert_N x vert_N matrix; rows of vertices
+            with zero degree are zero.
+    """
+    out = np.empty((1, tg.vert_N, tg.vert_N), dtype=np.float64)
+    a = _spectral_adjacency([tg.adjacency], weighted, out)[0]
+    if self_loops:
+        np.einsum('ii->i', a)[:] += 1
+    degrees = a.sum(axis=1)
+    with np.errstate(divide='ignore'):
+        scale = np.where(degrees > 0, 1 / np.sqrt(degrees), 0)
+    a *= scale[:, None]
+    a *= scale[None, :]
+    return a
+
+def get_laplacian_eigh_batch(graphs, kind='normalized', weighted=True):
+    """
+    Full eigendecompositions of the Laplacians of many graphs. Graphs of the
+    same size are stacked into one 3-D array and decomposed by a single 
+    np.linalg.eigh call.
+
+    Inputs:
+        graphs ([TinyGraph]): graphs to decompose.
+        kind (str): as in get_laplacian; the random walk Laplacian is not 
+            symmetric and is not supported.
+        weighted (bool): as in get_laplacian.
+
+    Outputs:
+        eigenvalues ([np array]): ascending eigenvalues of every graph.
+        eigenvectors ([np array]): for every graph, the matrix with the 
+            eigenvectors as columns.
+    """
+    if kind == 'random_walk':
+        raise ValueError("The random walk Laplacian is not symmetric.")
+    graphs = list(graphs)
+    sizes = np.array([g.vert_N for g in graphs], dtype=np.int64)
+    eigenvalues = [None] * len(graphs)
+    eigenvectors = [None] * len(graphs)
+    for N in np.unique(sizes):
+        same = np.flatnonzero(sizes == N)
+        stack = np.empty((len(same), N, N), dtype=np.float64)
+        _spectral_adjacency([graphs[b].adjacency for b in same], weighted, 
+                            stack)
+        values, vectors = np.linalg.eigh(_laplacian_in_place(stack, kind))
+        for i, b in enumerate(same):
+            eigenvalues[b] = values[i]
+            eigenvectors[b] = vectors[i]
+    return eigenvalues, eigenvectors
+
+def get_laplacian_eigsh(tg, k, kind='normalized', weighted=True, which='LA'):
+    """
+    A few eigenpairs of the Laplacian of a large graph with the Lanczos 
+    solver of scipy (which must be installed), working on a sparse matrix 
+    built from the neighbor index instead of a dense one.
+
+    Inputs:
+        tg (TinyGraph): graph to decompose.
+        k (int): number of eigenpairs, less than vert_N.
+        kind (str): 'combinatorial' or 'normalized', as in get_laplacian.
+        weighted (bool): as in get_laplacian.
+        which (str): which eigenpairs, as in scipy.sparse.linalg.eigsh: 'LA'
+            for the largest, 'SA' for the smallest eigenvalues.
+
+    Outputs:
+        eigenvalues (np array): the k eigenvalues, ascending.
+        eigenvectors (np array): vert_N x k matrix of eigenvectors as columns.
+    """
+    try:
+        from scipy.sparse import csr_matrix, identity, diags
+        from scipy.sparse.linalg import eigsh
+    except ModuleNotFoundError as e:
+        raise ImportError("get_laplacian_eigsh requires scipy") from e
+    if kind not in ('combinatorial', 'normalized'):
+        raise ValueError(f"unsupported Laplacian kind {kind}")
+    if weighted and not np.issubdtype(tg.adjacency.dtype, np.number):
+        raise TypeError("Graph weights are not numbers.")
+
+    index = get_neighbor_index(tg)
+    weights = index.weights if weighted else np.ones(len(index.indices))
+    a = csr_matrix((weights, index.indices, index.offsets), 
+                   shape=(tg.vert_N, tg.vert_N))
+    degrees = np.asarray(a.sum(axis=1)).ravel()
+    if kind == 'normalized':
+        with np.errstate(divide='ignore'):
+            scale = diags(np.where(degrees > 0, 1 / np.sqrt(degrees), 0))
+        laplacian = diags((degrees > 0).astype(np.float64)) - \
+            scale @ a @ scale
+    else:
+        laplacian = diags(degrees) - a
+    values, vectors = eigsh(laplacian, k=k, which=which)
+    order = np.argsort(values)
+    return values[order], vectors[:, order]
+
+
+### Neighbor aggregation ###
+
+# Sums and means over neighbors use the CSR neighbor index on graphs that are
+# both large enough and sparse enough, and a dense matrix product otherwise.
+AGGREGATE_SPARSE_MIN_VERT_N = 256
+AGGREGATE_SPARSE_MAX_DENSITY = 0.05
+
+_AGGREGATE_REDUCERS = {'sum' : np.add, 'mean' : np.add, 'max' : np.maximum,
+                       'min' : np.minimum}
+
+def _aggregate_sparse(index, x, op, weights):
+    """
+    Reduce the rows of x over the neighbors of every vertex of index with
+    reduceat over the arcs. Vertices without neighbors get zeros.
+    """
+    messages = x[index.indices]
+    if weights:
+        messages *= index.weights.reshape((-1,) + (1,) * (x.ndim - 1))
+    degrees = index.degrees
+    out = np.zeros((index.vert_N,) + x.shape[1:], dtype=x.dtype)
+    has_neighbors = degrees > 0
+    if len(messages) > 0:
+        # reduceat takes segment starts; empty segments are masked out
+        starts = index.offsets[:-1][has_neighbors]
+        out[has_neighbors] = _AGGREGATE_REDUCERS[op].reduceat(messages, 
+                                                              starts, axis=0)
+    if op == 'mean':
+        out[has_neighbors] /= degrees[has_neighbors].reshape(
+            (-1,) + (1,) * (x.ndim - 1))
+    return out
+
+def aggregate(g, x, op='sum', weights=False, method='auto'):
+    """
+    Reduce per-vertex features over the neighbors of every vertex, the
+    basic step of message passing: out[v] = op over neighbors u of x[u] 
+    (times the weight of the edge if weights). 
+
+    Inputs:
+        g (TinyGraph): graph to aggregate over.
+        x (np array): features with one row per vertex, of shape 
+            (vert_N, ...).
+        op (str): 'sum', 'mean', 'max' or 'min'. Vertices without neighbors
+            get zeros.
+        weights (bool): whether to multiply every neighbor's features by the 
+            weight of the edge to it.
+        method (str): 'sparse' for reduceat over the arcs of the neighbor 
+            index, 'dense' for the product adjacency @ x (sum and mean only),
+            or 'auto' to use the sparse path for max and min and on graphs 
+            with at least AGGREGATE_SPARSE_MIN_VERT_N vertices and an edge
+            density of at most AGGREGATE_SPARSE_MAX_DENSITY.
+
+    Outputs:
+        out (np array): aggregated features, of the shape of x and its 
+            dtype if floating point, float64 otherwise.
+    """
+    if op not in _AGGREGATE_REDUCERS:
+        raise ValueError(f"unknown aggregation {op}")
+    x = np.asarray(x)
+    if x.shape[0] != g.vert_N:
+        raise ValueError("Features must have one row per vertex.")
+    if weights and not np.issubdtype(g.adjacency.dtype, np.number):
+        raise TypeError("Graph weights are not numbers.")
+    dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+    x = x.astype(dtype, copy=False)
+
+    if method == 'auto':
+        N = g.vert_N
+        sparse = op in ('max', 'min') or (
+            N >= AGGREGATE_SPARSE_MIN_VERT_N and 
+            g.edge_N / (N * (N - 1) / 2) <= AGGREGATE_SPARSE_MAX_DENSITY)
+        method = 'sparse' if sparse else 'dense'
+    if method == 'sparse':
+        return _aggregate_sparse(get_neighbor_index(g), x, op, weights)
+    elif method != 'dense':
+        raise ValueError(f"unknown aggregation method {method}")
+    if op not in ('sum', 'mean'):
+        raise ValueError(f"dense aggregation does not support {op}")
+
+    if weights:
+        a = g.adjacency.astype(dtype)
+    else:
+        a = (g.adjacency != 0).astype(dtype)
+    out = (a @ x.reshape(g.vert_N, int(np.prod(x.shape[1:])))).reshape(x.shape)
+    if op == 'mean':
+        degrees = np.count_nonzero(g.adjacency, axis=1)
+        out[degrees > 0] /= degrees[degrees > 0].reshape(
+            (-1,) + (1,) * (x.ndim - 1))
+    return out
+
+def aggregate_batch(graphs, x, op='sum', weights=False):
+    """
+    aggregate over many graphs at once, with features of all graphs 
+    concatenated, in one pass over their combined neighbor index.
+
+    Inputs:
+        graphs ([TinyGraph]): graphs to aggregate over.
+        x (np array): features of the vertices of all graphs, concatenated in
+            order, of shape (total vertices, ...).
+        op (str): as in aggregate.
+        weights (bool): as in aggregate.
+
+    Outputs:
+        out (np array): aggregated features, in the layout of x.
+        offsets (np array): int64 array of length len(graphs) + 1; the rows 
+            of graph i are offsets[i]:offsets[i+1].
+    """
+    if op not in _AGGREGATE_REDUCERS:
+        raise ValueError(f"unknown aggregation {op}")
+    graphs = list(graphs)
+    if weights and any(not np.issubdtype(g.adjacency.dtype, np.number) 
+                       for g in graphs):
+        raise TypeError("Graph weights are not numbers.")
+    index = get_neighbor_index_batch(graphs)
+    x = np.asarray(x)
+    if x.shape[0] != index.vert_N:
+        raise ValueError("Features must have one row per vertex.")
+    dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+    return _aggregate_sparse(index, x.astype(dtype, copy=False), op, 
+                             weights), index.graph_offsets
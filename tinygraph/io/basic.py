@@ -300,3 +300,90 @@ def from_binary(fileobj):
     g.props = props
 
     return g
+
+def to_edge_index(graphs, vert_props=None, edge_props=None, weight=False,
+                  symmetric=True, dtype=np.float32):
+    """
+    Export one or more graphs in the sparse COO layout used by message passing
+    libraries: a [2, E] edge_index, an [E, Fe] edge attribute matrix, an
+    [N, F] vertex feature matrix and a [N] batch vector mapping each vertex
+    to its graph. All edges of all graphs are found with a single np.nonzero
+    over the concatenated adjacency matrices, and are mapped back to their
+    graph and endpoints with offset arithmetic.
+
+    Inputs:
+        graphs (TinyGraph or list): A graph or a list of graphs, all with the
+            properties requested.
+        vert_props ([str]): Vertex properties stacked, in order, as feature
+            columns. None uses all vertex properties of the first graph.
+        edge_props ([str]): Edge properties stacked, in order, as attribute
+            columns. None uses all edge properties of the first graph.
+        weight (bool): Prepend the adjacency value of each edge as the first
+            attribute column.
+        symmetric (bool): Emit every edge in both directions, as message 
+            passing expects. If False, each edge appears once with i < j.
+        dtype (np.dtype): dtype of the edge attribute and vertex feature
+            matrices.
+
+    Outputs:
+        edge_index (np.ndarray): [2, E] int64 global endpoint indices, sorted
+            by source then target.
+        edge_attr (np.ndarray): [E, Fe] edge attributes.
+        x (np.ndarray): [N, F] vertex features.
+        batch (np.ndarray): [N] int64 graph index of every vertex.
+    """
+    if isinstance(graphs, tg.TinyGraph):
+        graphs = [graphs]
+    graphs = list(graphs)
+    if vert_props is None:
+        vert_props = list(graphs[0].v.keys()) if len(graphs) > 0 else []
+    if edge_props is None:
+        edge_props = list(graphs[0].e.keys()) if len(graphs) > 0 else []
+
+    sizes = np.array([g.vert_N for g in graphs], dtype=np.int64)
+    vert_offsets = np.zeros(len(graphs) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=vert_offsets[1:])
+    flat_offsets = np.zeros(len(graphs) + 1, dtype=np.int64)
+    np.cumsum(sizes * sizes, out=flat_offsets[1:])
+    batch = np.repeat(np.arange(len(graphs), dtype=np.int64), sizes)
+
+    # One nonzero pass over every adjacency, then recover (graph, i, j)
+    adjacency = np.concatenate([g.adjacency.ravel() for g in graphs]) \
+        if len(graphs) > 0 else np.zeros(0)
+    flat = np.flatnonzero(adjacency)
+    owner = np.searchsorted(flat_offsets, flat, side='right') - 1
+    local = flat - flat_offsets[owner]
+    rows, cols = np.divmod(local, sizes[owner])
+    if not symmetric:
+        keep = rows < cols
+        flat, owner, rows, cols = flat[keep], owner[keep], rows[keep], \
+            cols[keep]
+    edge_index = np.stack([rows + vert_offsets[owner], 
+                           cols + vert_offsets[owner]])
+
+    # edges come out grouped by graph, so each graph's property values are
+    # gathered at its own (row, col) pairs only
+    edge_offsets = np.zeros(len(graphs) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner, minlength=len(graphs)), out=edge_offsets[1:])
+
+    columns = []
+    if weight:
+        columns.append(adjacency[flat].reshape(-1, 1))
+    for prop in edge_props:
+        # explicit width, since -1 cannot be inferred without edges
+        width = int(np.prod(graphs[0].e_p[prop].shape[2:]))
+        columns.append(np.concatenate(
+            [g.e_p[prop][rows[s:e], cols[s:e]].reshape(e - s, width)
+             for g, s, e in zip(graphs, edge_offsets[:-1], edge_offsets[1:])]))
+    edge_attr = np.concatenate(columns, axis=1).astype(dtype) \
+        if len(columns) > 0 else np.zeros((len(flat), 0), dtype=dtype)
+
+    columns = []
+    for prop in vert_props:
+        width = int(np.prod(graphs[0].v[prop].shape[1:]))
+        columns.append(np.concatenate([g.v[prop].reshape(g.vert_N, width)
+                                       for g in graphs]))
+    x = np.concatenate(columns, axis=1).astype(dtype) \
+        if len(columns) > 0 else np.zeros((len(batch), 0), dtype=dtype)
+
+    return edge_index, edge_attr, x, batch
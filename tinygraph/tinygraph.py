@@ -206,6 +206,13 @@ class TinyGraph:
             self.add_edge_prop(k, dt)
 
         self.props = {}
+
+        # Bumped by every change to the graph structure, so that structures 
+        # derived from it (such as the compiled neighbor index used by the
+        # algorithms) know when they have to be rebuilt.
+        self._version = 0
+        self._neighbor_index = None
+        self._connectivity = None
         
     @property
     def vert_N(self):
@@ -219,6 +226,20 @@ class TinyGraph:
         else:
             return e//2
 
+    def invalidate_caches(self):
+        """
+        Mark the graph structure as changed. TinyGraph methods do this on
+        their own; call it after writing into the adjacency matrix directly
+        (e.g. g.adjacency[i, j] = w) so cached structures are rebuilt.
+
+        Inputs:
+            None
+
+        Outputs:
+            None
+        """
+        self._version += 1
+
     def add_vert_prop(self, name, dtype):
         """
         Add the vertex property named 'name' to the graph. 
@@ -315,6 +336,7 @@ class TinyGraph:
 
         # Update the vertex count
         self.__vert_N += 1
+        self._version += 1
 
     def remove_vertex(self, n):
         """
@@ -344,6 +366,7 @@ class TinyGraph:
 
         # Update the vertex count
         self.__vert_N -= 1
+        self._version += 1
 
     def __setitem__(self, key, newValue):
         """
@@ -365,9 +388,15 @@ class TinyGraph:
         e1, e2 = key
         if e1 == e2:
             raise IndexError("Self-loops are not allowed.")
+        zero = default_zero(self.adjacency.dtype)
+        was_edge = self.adjacency[e1, e2] != zero
         self.adjacency[e1, e2] = newValue
         self.adjacency[e2, e1] = newValue
-        if newValue == default_zero(self.adjacency.dtype):
+        self._version += 1
+        is_edge = self.adjacency[e1, e2] != zero
+        if self._connectivity is not None:
+            self._connectivity._edge_changed(self, e1, e2, was_edge, is_edge)
+        if newValue == zero:
             for k, prop in self.e_p.items():
                 self.e_p[k][e1, e2] = default_zero(prop.dtype)
                 self.e_p[k][e2, e1] = default_zero(prop.dtype)
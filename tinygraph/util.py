@@ -2,6 +2,7 @@ import numpy as np
 import tinygraph as tg
 from tinygraph import EdgeProxy
 from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
 import warnings
 
 def graph_equality(g1, g2):
@@ -40,7 +41,22 @@ def graph_equality(g1, g2):
 
     return True
 
-def _subgraph_relabel(g, vert_iter):
+def _take_both_axes(a, idx, out):
+    """
+    Write a[idx][:, idx] into out. The two np.take calls only need a single
+    len(idx) x N temporary, instead of the N^2 index arrays that fancy 
+    indexing with (rows, cols) pairs would materialize.
+    """
+    np.take(np.take(a, idx, axis=0), idx, axis=1, out=out)
+
+def _all_zero(a):
+    """
+    Whether a numeric or bool array is all zero. Other dtypes (e.g. strings)
+    are never reported as zero, so they are always copied.
+    """
+    return a.dtype.kind in 'biufc' and not np.any(a)
+
+def _subgraph_relabel(g, vert_iter, inplace=False):
     """
     Helper function to perform the work of permute and subgraph. Not intended 
     for use by end-users. See instead functions permute and subgraph below.
@@ -55,41 +71,46 @@ def _subgraph_relabel(g, vert_iter):
             the vertices of the subgraph. Contrary to permute(), here we expect
                 vert_iter[new_vertex] = old_vertex
             to support dropping (and possibly duplicating) old vertices.
+        inplace (bool): Overwrite g instead of building a new graph. Only valid
+            when vert_iter is a permutation of g's vertices.
 
     Outputs:
         sg (TinyGraph): subgraph with vertices in the same order as vert_iter.
     """
-    N = len(vert_iter)
-    new_g = tg.empty_like(g, N)
-    # Copy graph props
-    # new_g.props = {k:v for k, v in g.props.items()}
-    new_g.props = deepcopy(g.props)
+    idx = np.asarray(vert_iter, dtype=np.intp)
+    N = len(idx)
+    if inplace:
+        new_g = g
+    else:
+        new_g = tg.empty_like(g, N)
+        # Copy graph props
+        new_g.props = deepcopy(g.props)
 
     if N == 0:
         # Weird things happen if we keep going ;_;
         return new_g
 
-    # Magic index converter eliminates python-for-loops
-    # at the expense of ignoring sparsity (moves everything)
-    new_list = np.arange(N) # list of the new vertices
-    #vert_iter is a list of old vertices ordered by destination indices
-    old_indices = (np.repeat(new_list,  N),  np.tile(new_list,  N))
-    new_indices = (np.repeat(vert_iter, N),  np.tile(vert_iter, N))
-
-    # Copy edge values
-    new_g.adjacency[old_indices] = g.adjacency[new_indices]
+    # Properties that are all zero stay zero under any relabeling, and the
+    # arrays of a fresh graph already are, so they need no work at all
+    if not _all_zero(g.adjacency):
+        _take_both_axes(g.adjacency, idx, new_g.adjacency)
 
     # Copy vertex properties
     for prop in g.v.keys():
-        new_g.v[prop][:] = g.v[prop][vert_iter]
+        if not _all_zero(g.v[prop]):
+            new_g.v[prop][:] = g.v[prop][idx]
 
     # Copy edge properties
     for prop in g.e.keys():
-        new_g.e_p[prop][old_indices] = g.e_p[prop][new_indices]
+        if not _all_zero(g.e_p[prop]):
+            _take_both_axes(g.e_p[prop], idx, new_g.e_p[prop])
+
+    if inplace:
+        g.invalidate_caches()
 
     return new_g
 
-def permute(g, perm):
+def permute(g, perm, inplace=False):
     """
     Permute the vertices of a graph to create a new TinyGraph instance.
 
@@ -97,10 +118,13 @@ def permute(g, perm):
         g (TinyGraph): Original TinyGraph to permute.
         perm (iterable): A mapping from old vertices to new vertices, such that
             perm[old_vertex] = new_vertex.
+        inplace (bool): Permute g itself rather than a copy, avoiding the
+            allocation of a second graph.
 
     Outputs:
         new_g (TinyGraph): A new TinyGraph instance with each vertex, and its
-            corresponding vertex and edge properties, permuted.
+            corresponding vertex and edge properties, permuted. g itself when
+            inplace is True.
     """
     # Internally uses a list
     perm = [perm[i] for i in range(len(perm))]
@@ -112,7 +136,7 @@ def permute(g, perm):
     # Flip the order of stuff in perm
     perm_inv = np.argsort(perm)
 
-    return _subgraph_relabel(g, perm_inv)
+    return _subgraph_relabel(g, perm_inv, inplace)
 
 def subgraph(g, vertices):
     """
@@ -154,84 +178,213 @@ def merge(g1, g2):
         new_g (TinyGraph): result of the merge. Note: data is detached from any
             data living within g1 or g2.
     """
-    # Check for type matching
-    if g1.adjacency.dtype != g2.adjacency.dtype:
-        raise TypeError("g1 and g2 do not share adjacency matrix types: "
-                        f"({g1.adjacency.dtype} vs {g2.adjacency.dtype})!")
-    adj_type = g1.adjacency.dtype
-
-    vp_type1 = {p:val.dtype for p, val in g1.v.items()}
-    vp_type2 = {p:val.dtype for p, val in g2.v.items()}
-    for k in vp_type1.keys():
-        if k in vp_type2.keys():
-            if vp_type1[k] != vp_type2[k]:
-                raise TypeError(f"dtype for vertex property '{k}' does not"
-                                f"match: {vp_type1[k]} vs {vp_type2[k]}")
-    vp_types = {**vp_type1, **vp_type2}
+    return merge_all([g1, g2])
 
+def merge_all(graphs):
+    """
+    Produces a new graph resulting from taking the disjoint union of the 
+    vertices of all graphs, in order. The union of the property schemas is 
+    computed once, the result is allocated once and each graph is written as
+    one diagonal block by slice assignment, so merging k graphs costs a single
+    pass over the output instead of k chained merges. Raises a TypeError in 
+    case the adjacency matrices or same-named properties are of different
+    dtypes. Raises a warning in case the vertex or edge properties differ; a
+    graph lacking a property gets zeros for it. Combines the graph properties,
+    favoring earlier graphs in case of key collision.
 
-    ep_type1 = {p:val.dtype for p, val in g1.e.items()}
-    ep_type2 = {p:val.dtype for p, val in g2.e.items()}
-    for k in ep_type1.keys():
-        if k in ep_type2.keys():
-            if ep_type1[k] != ep_type2[k]:
+    Inputs:
+        graphs (list): TinyGraphs to merge; must not be empty.
+
+    Output:
+        new_g (TinyGraph): result of the merge. Note: data is detached from any
+            data living within graphs.
+    """
+    graphs = list(graphs)
+    if len(graphs) == 0:
+        raise ValueError("merge_all needs at least one graph")
+
+    # Check for type matching
+    adj_types = set(g.adjacency.dtype for g in graphs)
+    if len(adj_types) > 1:
+        raise TypeError("graphs do not share adjacency matrix types: "
+                        f"{adj_types}!")
+    adj_type = graphs[0].adjacency.dtype
+
+    vp_types = {}
+    ep_types = {}
+    for g in graphs:
+        for k, val in g.v.items():
+            if vp_types.setdefault(k, val.dtype) != val.dtype:
+                raise TypeError(f"dtype for vertex property '{k}' does not"
+                                f"match: {vp_types[k]} vs {val.dtype}")
+        for k, val in g.e.items():
+            if ep_types.setdefault(k, val.dtype) != val.dtype:
                 raise TypeError(f"dtype for edge property '{k}' does not match:"
-                                f" {ep_type1[k]} vs {ep_type2[k]}")
-    ep_types = {**ep_type1, **ep_type2}
+                                f" {ep_types[k]} vs {val.dtype}")
 
     # Warnings after errors
-    if set(g1.v.keys()) != set(g2.v.keys()):
+    if any(set(g.v.keys()) != set(vp_types) for g in graphs):
         warnings.warn(f"util.merge: vertex properties don't all match but will "
-                      f"be merged automatically: {set(g1.v.keys())} and "
-                      f"{set(g2.v.keys())} will result in "
-                      f"{set(g1.v.keys()).union(set(g2.v.keys()))}")
-    if set(g1.e.keys()) != set(g2.e.keys()):
+                      f"be merged automatically: "
+                      f"{[set(g.v.keys()) for g in graphs]} will result in "
+                      f"{set(vp_types)}")
+    if any(set(g.e.keys()) != set(ep_types) for g in graphs):
         warnings.warn(f"util.merge: edge properties don't all match but will be"
-                      f" merged automatically: {set(g1.e.keys())} and "
-                      f"{set(g2.e.keys())} will result in "
-                      f"{set(g1.e.keys()).union(set(g2.e.keys()))}")
+                      f" merged automatically: "
+                      f"{[set(g.e.keys()) for g in graphs]} will result in "
+                      f"{set(ep_types)}")
 
-    # Initialize the new merged graph
-    N = g1.vert_N + g2.vert_N
+    # Initialize the new merged graph, which starts out all zero off the
+    # diagonal blocks and for every property a graph is missing
+    N = sum(g.vert_N for g in graphs)
     new_g = tg.TinyGraph(N, adj_type, vp_types, ep_types)
 
-    new_g.props = {**g2.props, **g1.props} # g1 later gives it precedence
+    for g in reversed(graphs): # earlier graphs last gives them precedence
+        new_g.props.update(g.props)
 
-    # Vertex properties
-    i1 = np.arange(g1.vert_N)
-    i2 = np.arange(g1.vert_N, g1.vert_N+g2.vert_N)
+    start = 0
+    for g in graphs:
+        end = start + g.vert_N
+        new_g.adjacency[start:end, start:end] = g.adjacency
+        for prop, val in g.v.items():
+            new_g.v[prop][start:end] = val
+        for prop, val in g.e_p.items():
+            new_g.e_p[prop][start:end, start:end] = val
+        start = end
 
-    for prop, prop_type in vp_types.items():
-        # Load stuff from g1
-        new_g.v[prop][i1] = g1.v[prop] if prop in vp_type1.keys() \
-            else tg.default_zero(prop_type)
+    return new_g
 
-        # Load stuff from g2
-        new_g.v[prop][i2] = g2.v[prop] if prop in vp_type2.keys() \
-            else tg.default_zero(prop_type)
 
-    # Edge indices for easy manipulation
-    i11 = (np.repeat(i1, len(i1)), np.tile(i1, len(i1)))
-    i12 = (np.repeat(i1, len(i2)), np.tile(i2, len(i1)))
-    i21 = (np.repeat(i2, len(i1)), np.tile(i1, len(i2)))
-    i22 = (np.repeat(i2, len(i2)), np.tile(i2, len(i2)))
+def map_graphs(fn, graphs, workers=None):
+    """
+    Apply fn to every graph using a pool of threads. The compiled algorithms
+    in tinygraph release the GIL while they run, so threads can work on 
+    different graphs concurrently without the serialization cost of a process
+    pool.
 
-    # Edge weights
-    new_g.adjacency[i11] = g1.adjacency.flatten()
-    new_g.adjacency[i22] = g2.adjacency.flatten()
+    Inputs:
+        fn (callable): Function taking a single graph, e.g. 
+            tinygraph.algorithms.get_connected_components.
+        graphs (iterable): The graphs to apply fn to.
+        workers (int): Number of threads. None lets ThreadPoolExecutor pick
+            its default, 1 runs everything in the calling thread.
+
+    Outputs:
+        results (list): fn(g) for every g in graphs, in order.
+    """
+    if workers == 1:
+        return [fn(g) for g in graphs]
 
-    new_g.adjacency[i12] = tg.default_zero(adj_type)
-    new_g.adjacency[i21] = tg.default_zero(adj_type)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fn, graphs))
 
-    # Edge properties
-    for prop, prop_type in ep_types.items():
-        new_g.e_p[prop][i11] = g1.e_p[prop].flatten() \
-            if prop in ep_type1.keys() else tg.default_zero(prop_type)
 
-        new_g.e_p[prop][i22] = g2.e_p[prop].flatten() \
-            if prop in ep_type2.keys() else tg.default_zero(prop_type)
+def _feature_columns(arrays, width):
+    """
+    Flatten each per-vertex property array into width columns, so that
+    multi-dimensional property dtypes contribute one column per element.
+    """
+    return [a.reshape(a.shape[0], width) for a in arrays]
 
-        new_g.e_p[prop][i12] = tg.default_zero(prop_type)
-        new_g.e_p[prop][i21] = tg.default_zero(prop_type)
+def collate(graphs, vert_props=None, edge_props=None, n_max=None,
+            dtype=np.float32):
+    """
+    Stack a list of graphs into zero-padded dense arrays, as used when 
+    training on minibatches. Nmax is computed once, each output is allocated
+    once, and every graph is written with a single block copy per array 
+    (vertex features for the whole batch are written with one masked 
+    assignment per property).
 
-    return new_g
+    Inputs:
+        graphs (list): TinyGraphs to collate, all with the properties requested.
+        vert_props (list): Vertex properties stacked, in order, as feature 
+            columns. None uses all vertex properties of graphs[0].
+        edge_props (list): Edge properties stacked, in order, as feature 
+            columns. None uses all edge properties of graphs[0].
+        n_max (int): Pad to this many vertices instead of the largest graph,
+            for fixed-shape models. Raises a ValueError if a graph is larger.
+        dtype (np.dtype): dtype of the vertex and edge feature arrays.
+
+    Outputs:
+        adjacency (np.ndarray): [B, Nmax, Nmax] adjacency matrices, in the
+            common dtype of the graphs' adjacencies.
+        vert_features (np.ndarray): [B, Nmax, F] vertex features.
+        edge_features (np.ndarray): [B, Nmax, Nmax, Fe] edge features.
+        mask (np.ndarray): [B, Nmax] bool, True for real (unpadded) vertices.
+    """
+    graphs = list(graphs)
+    if vert_props is None:
+        vert_props = list(graphs[0].v.keys()) if len(graphs) > 0 else []
+    if edge_props is None:
+        edge_props = list(graphs[0].e.keys()) if len(graphs) > 0 else []
+
+    sizes = np.array([g.vert_N for g in graphs], dtype=np.int64)
+    largest = int(sizes.max()) if len(graphs) > 0 else 0
+    if n_max is None:
+        n_max = largest
+    elif largest > n_max:
+        raise ValueError(f"Graph with {largest} vertices does not fit in "
+                         f"n_max={n_max}")
+
+    adj_type = np.result_type(*[g.adjacency.dtype for g in graphs]) \
+        if len(graphs) > 0 else np.float64
+    B = len(graphs)
+
+    mask = np.arange(n_max) < sizes[:, None]
+
+    # Vertex features: one masked scatter per property over the whole batch,
+    # since mask is row-major in the same order as the concatenated vertices
+    widths = [int(np.prod(graphs[0].v[p].shape[1:])) if B > 0 else 1
+              for p in vert_props]
+    vert_features = np.zeros((B, n_max, sum(widths)), dtype=dtype)
+    col = 0
+    for prop, width in zip(vert_props, widths):
+        if B > 0:
+            columns = _feature_columns([g.v[prop] for g in graphs], width)
+            vert_features[mask, col:col+width] = np.concatenate(columns)
+        col += width
+
+    widths = [int(np.prod(graphs[0].e_p[p].shape[2:])) if B > 0 else 1
+              for p in edge_props]
+    adjacency = np.zeros((B, n_max, n_max), dtype=adj_type)
+    edge_features = np.zeros((B, n_max, n_max, sum(widths)), dtype=dtype)
+    for b, g in enumerate(graphs):
+        N = g.vert_N
+        adjacency[b, :N, :N] = g.adjacency
+        col = 0
+        for prop, width in zip(edge_props, widths):
+            edge_features[b, :N, :N, col:col+width] = \
+                g.e_p[prop].reshape(N, N, width)
+            col += width
+
+    return adjacency, vert_features, edge_features, mask
+
+def bucket_by_size(graphs, batch_size, rng=None):
+    """
+    Group graphs into batches of similar vertex counts so that collate() pads
+    as little as possible. Graphs are ordered by size and cut into consecutive
+    batches; with an rng, graphs of equal size are drawn in random order and 
+    the batches themselves are shuffled.
+
+    Inputs:
+        graphs (list): TinyGraphs (or anything with a vert_N) to group.
+        batch_size (int): Maximum number of graphs per batch.
+        rng (np.random.Generator): Optional source of randomness for shuffling.
+
+    Outputs:
+        batches (list): Arrays of indices into graphs, one per batch.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    sizes = np.array([g.vert_N for g in graphs], dtype=np.int64)
+
+    order = np.arange(len(sizes))
+    if rng is not None:
+        order = rng.permutation(len(sizes))
+    order = order[np.argsort(sizes[order], kind='stable')]
+
+    batches = [order[i:i+batch_size] 
+               for i in range(0, len(order), batch_size)]
+    if rng is not None:
+        batches = [batches[i] for i in rng.permutation(len(batches))]
+    return batches